@@ -0,0 +1,149 @@
+# admission.py
+"""
+Admission control for the CPU / SMTP heavy auth routes
+(/login, /forgotPass, /reset-password).
+
+Before any work is done a request must pass:
+- a token bucket per client IP and one per account (email / uid) for that
+  route - credential stuffing and reset-link spam run dry quickly
+- the shared AUTH_BUDGET of concurrently running auth requests
+
+Anything over the limit gets an immediate 429 with Retry-After, so bursts
+never queue up in front of pbkdf2 (passwords.py) or SMTP.
+State is per process.
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+
+AUTH_MAX_CONCURRENT = int(os.getenv("AUTH_MAX_CONCURRENT", "16"))
+BUCKETS_MAX_KEYS = 100_000  # LRU bound on tracked IPs / accounts per limiter
+
+
+class Rate(NamedTuple):
+    burst: int           # bucket size
+    per_sec: float       # refill speed (tokens / second)
+
+
+def per_minute(burst: int, n: float) -> Rate:
+    return Rate(burst, n / 60.0)
+
+
+def per_hour(burst: int, n: float) -> Rate:
+    return Rate(burst, n / 3600.0)
+
+
+def too_many(retry_after: float, detail: str = "Too many requests") -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class TokenBuckets:
+    """One token bucket per key, LRU-bounded."""
+
+    def __init__(self, rate: Rate, max_keys: int = BUCKETS_MAX_KEYS) -> None:
+        self.rate = rate
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()  # key -> (tokens, at)
+
+    def take(self, key: str) -> float:
+        """Take one token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, at = self._buckets.pop(key, (float(self.rate.burst), now))
+            tokens = min(float(self.rate.burst), tokens + (now - at) * self.rate.per_sec)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate.per_sec
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)  # idle the longest -> refilled anyway
+            return wait
+
+
+class ConcurrencyBudget:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_use = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        # only touched from the event loop thread
+        if self.in_use >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_use += 1
+        return True
+
+    def release(self) -> None:
+        self.in_use -= 1
+
+
+AUTH_BUDGET = ConcurrencyBudget(AUTH_MAX_CONCURRENT)
+
+
+def client_ip(request: Request) -> str:
+    # uvicorn --proxy-headers already resolves X-Forwarded-For into request.client
+    return request.client.host if request.client else "unknown"
+
+
+class Admission:
+    def __init__(self, name: str, per_ip: Rate, per_account: Rate,
+                 budget: ConcurrencyBudget = AUTH_BUDGET) -> None:
+        self.name = name
+        self._ip = TokenBuckets(per_ip)
+        self._account = TokenBuckets(per_account)
+        self._budget = budget
+        self.admitted = 0
+        self.limited = 0
+
+    @asynccontextmanager
+    async def admit(self, request: Request, account: Optional[str] = None) -> AsyncIterator[None]:
+        """async with LOGIN_ADMISSION.admit(request, email): ... -> 429 when over a limit."""
+        wait = self._ip.take(client_ip(request))
+        if account and not wait:
+            wait = self._account.take(account.strip().lower())
+        if wait:
+            self.limited += 1
+            raise too_many(wait)
+        if not self._budget.try_acquire():
+            self.limited += 1
+            raise too_many(1, "Server busy, please retry")
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self._budget.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"admitted": self.admitted, "limited": self.limited}
+
+
+LOGIN_ADMISSION = Admission("login", per_ip=per_minute(20, 10), per_account=per_minute(5, 2))
+FORGOT_PASS_ADMISSION = Admission("forgotPass", per_ip=per_hour(5, 10), per_account=per_hour(2, 3))
+RESET_PASSWORD_ADMISSION = Admission("reset-password", per_ip=per_hour(10, 20), per_account=per_hour(3, 5))
+
+
+def admission_stats() -> Dict[str, object]:
+    return {
+        "budget": {
+            "limit": AUTH_BUDGET.limit,
+            "in_use": AUTH_BUDGET.in_use,
+            "rejected": AUTH_BUDGET.rejected,
+        },
+        **{a.name: a.stats() for a in (LOGIN_ADMISSION, FORGOT_PASS_ADMISSION, RESET_PASSWORD_ADMISSION)},
+    }
@@ -0,0 +1,64 @@
+# block_cache.py
+"""
+Per-viewer hidden set for /search/suggest: the viewer plus everyone they
+blocked or who blocked them. Typeahead runs on every keystroke, so the set
+is kept in memory instead of querying user_blocks each time.
+
+- block_user() invalidates both sides of a block made on this worker
+- blocks made on other workers show up within BLOCK_CACHE_TTL_SEC
+- /search and /users keep reading user_blocks per request (hidden_peer_ids)
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import AbstractSet, FrozenSet, Optional
+
+BLOCK_CACHE_TTL_SEC = int(os.getenv("BLOCK_CACHE_TTL_SEC", "60"))
+BLOCK_CACHE_MAX_ENTRIES = 50_000
+
+
+class HiddenPeerCache:
+    """viewer id -> frozenset of hidden member ids, TTL + LRU."""
+
+    def __init__(self, max_entries: int, ttl_sec: int) -> None:
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, tuple[float, FrozenSet[int]]]" = OrderedDict()
+        # bumped by every invalidation; a set read across one is not stored
+        self.generation = 0
+
+    def get(self, user_id: int) -> Optional[FrozenSet[int]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id: int, hidden: AbstractSet[int], generation: int) -> FrozenSet[int]:
+        hidden = frozenset(hidden)
+        with self._lock:
+            if generation != self.generation:
+                return hidden
+            self._entries[user_id] = (time.monotonic() + self.ttl_sec, hidden)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return hidden
+
+    def invalidate(self, *user_ids: int) -> None:
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+HIDDEN_PEERS = HiddenPeerCache(BLOCK_CACHE_MAX_ENTRIES, BLOCK_CACHE_TTL_SEC)
@@ -1,6 +1,18 @@
+import os
 import platform
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from fastapi import Request
+from starlette.datastructures import MutableHeaders
 from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from sessions import peek_session_user_id, read_pin_cookie, read_pin_until
 
 SYSTEM = platform.system()  # 'Windows', 'Linux', 'Darwin'
 if SYSTEM == "Windows": #dev
@@ -10,9 +22,325 @@ elif SYSTEM == "Linux": #prod
 else:
     raise RuntimeError(f"Unsupported OS: {SYSTEM}")
 
-engine = create_engine(DATABASE_URL, future=True)
+
+def _to_async_url(url: str) -> str:
+    return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+# same database, asyncpg driver (used by the hot async endpoints)
+ASYNC_DATABASE_URL = _to_async_url(DATABASE_URL)
+
+# optional streaming replica for read-only endpoints; unset -> reads use the primary
+REPLICA_DATABASE_URL = os.getenv("DATABASE_REPLICA_URL") or None
+
+
+# -----------------------------
+# Pool tuning (env)
+# -----------------------------
+# Each engine gets its own pool, per uvicorn worker:
+#   max connections ~= workers * 2 engines * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    v = os.getenv(name)
+    if v is None:
+        return default
+    return v.strip().lower() in ("1", "true", "yes", "on")
+
+
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)            # seconds to wait for a free connection
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)          # seconds, -1 = never
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)  # 0 = no limit
+# server-side prepared statements kept per asyncpg connection
+DB_PREPARED_STATEMENT_CACHE_SIZE = _env_int("DB_PREPARED_STATEMENT_CACHE_SIZE", 500)
+
+# after a write, that user's reads stay on the primary for this long (replica lag)
+DB_READ_YOUR_WRITES_SEC = _env_int("DB_READ_YOUR_WRITES_SEC", 5)
+# after a failed replica checkout, skip the replica for this long
+DB_REPLICA_RETRY_SEC = _env_int("DB_REPLICA_RETRY_SEC", 30)
+
+
+# -----------------------------
+# Pool metrics
+# -----------------------------
+# checkout wait histogram buckets (seconds, upper bounds)
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+
+class CheckoutHistogram:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * len(CHECKOUT_BUCKETS)
+        self.total = 0
+        self.sum_seconds = 0.0
+        self.max_seconds = 0.0
+        self.failed = 0  # pool timeout or connect error
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            for i, upper in enumerate(CHECKOUT_BUCKETS):
+                if seconds <= upper:
+                    self.counts[i] += 1
+                    break
+            self.total += 1
+            self.sum_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def failed_checkout(self) -> None:
+        with self._lock:
+            self.failed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.total,
+                "failed": self.failed,
+                "avg_ms": (self.sum_seconds / self.total * 1000) if self.total else 0.0,
+                "max_ms": self.max_seconds * 1000,
+                "buckets": {
+                    ("+Inf" if upper == float("inf") else f"{upper * 1000:g}ms"): c
+                    for upper, c in zip(CHECKOUT_BUCKETS, self.counts)
+                },
+            }
+
+
+def _timed_pool(base):
+    # times how long a checkout waits for a connection (incl. opening a new one)
+    class _TimedPool(base):
+        histogram: CheckoutHistogram
+
+        def _do_get(self):
+            t0 = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except Exception:
+                self.histogram.failed_checkout()
+                raise
+            self.histogram.observe(time.perf_counter() - t0)
+            return conn
+
+    _TimedPool.histogram = CheckoutHistogram()
+    _TimedPool.__name__ = f"Timed{base.__name__}"
+    return _TimedPool
+
+
+def _pool_kwargs() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _sync_connect_args() -> dict:
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+
+def _async_connect_args() -> dict:
+    args = {"prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return args
+
+
+def _make_engine(url: str):
+    return create_engine(
+        url,
+        future=True,
+        poolclass=_timed_pool(QueuePool),
+        connect_args=_sync_connect_args(),
+        **_pool_kwargs(),
+    )
+
+
+def _make_async_engine(url: str):
+    return create_async_engine(
+        url,
+        poolclass=_timed_pool(AsyncAdaptedQueuePool),
+        connect_args=_async_connect_args(),
+        **_pool_kwargs(),
+    )
+
+
+def _make_async_sessionmaker(bind):
+    # expire_on_commit=False: attributes must stay readable after commit,
+    # an async session cannot lazy-load them back during serialization
+    return async_sessionmaker(
+        bind=bind,
+        class_=AsyncSession,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
+engine = _make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+async_engine = _make_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = _make_async_sessionmaker(async_engine)
+
+replica_engine = None
+ReplicaSessionLocal = None
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+if REPLICA_DATABASE_URL:
+    replica_engine = _make_engine(REPLICA_DATABASE_URL)
+    ReplicaSessionLocal = sessionmaker(bind=replica_engine, autoflush=False, autocommit=False)
+    async_replica_engine = _make_async_engine(_to_async_url(REPLICA_DATABASE_URL))
+    AsyncReplicaSessionLocal = _make_async_sessionmaker(async_replica_engine)
+
+
+def _pool_stats(pool) -> dict:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # negative while the pool has not opened pool_size connections yet
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checkout_wait": pool.histogram.snapshot(),
+    }
+
+
+def pool_status() -> dict:
+    status = {
+        "config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+            "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+        },
+        "sync": _pool_stats(engine.pool),
+        "async": _pool_stats(async_engine.sync_engine.pool),
+    }
+    if REPLICA_DATABASE_URL:
+        status["replica"] = {
+            "available": _replica_available(),
+            "sync": _pool_stats(replica_engine.pool),
+            "async": _pool_stats(async_replica_engine.sync_engine.pool),
+        }
+    return status
+
+
+# -----------------------------
+# Read routing (replica + read-your-writes)
+# -----------------------------
+# A write pins the writer's reads to the primary in two places:
+#   - _RECENT_WRITERS, this worker only (covers websocket writes, which
+#     cannot set cookies)
+#   - a signed "read_pin" cookie on the HTTP response (ReadPinMiddleware),
+#     checked by every worker, so the next request may land anywhere
+_RECENT_WRITERS: Dict[int, float] = {}  # userId -> monotonic deadline
+_REPLICA_DOWN_UNTIL = 0.0
+# per HTTP request: {"until": epoch sec} once the request wrote
+_WRITE_PIN: ContextVar[Optional[Dict[str, float]]] = ContextVar("write_pin", default=None)
+
+
+def mark_recent_write(user_id: Optional[int]) -> None:
+    """Pin this user's reads to the primary for DB_READ_YOUR_WRITES_SEC."""
+    if not user_id or not REPLICA_DATABASE_URL:
+        return
+    pin = _WRITE_PIN.get()
+    if pin is not None:
+        pin["until"] = time.time() + DB_READ_YOUR_WRITES_SEC
+    now = time.monotonic()
+    _RECENT_WRITERS[int(user_id)] = now + DB_READ_YOUR_WRITES_SEC
+    # drop expired entries so the dict stays small
+    if len(_RECENT_WRITERS) > 10_000:
+        for uid, deadline in list(_RECENT_WRITERS.items()):
+            if deadline < now:
+                _RECENT_WRITERS.pop(uid, None)
+
+
+def _replica_available() -> bool:
+    return bool(REPLICA_DATABASE_URL) and time.monotonic() >= _REPLICA_DOWN_UNTIL
+
+
+def _mark_replica_down() -> None:
+    global _REPLICA_DOWN_UNTIL
+    _REPLICA_DOWN_UNTIL = time.monotonic() + DB_REPLICA_RETRY_SEC
+
+
+def _use_replica(request: Request, user_id: Optional[int]) -> bool:
+    if not _replica_available():
+        return False
+    if user_id is not None and _RECENT_WRITERS.get(user_id, 0.0) > time.monotonic():
+        return False
+    if read_pin_until(request) > time.time():
+        return False
+    return True
+
+
+class ReadPinMiddleware:
+    """
+    Sets the read pin cookie on responses to requests that called
+    mark_recent_write(). Plain ASGI so the pin dict is shared with the
+    endpoint (also when it runs in the threadpool) and headers can be added
+    before the response starts.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not REPLICA_DATABASE_URL:
+            await self.app(scope, receive, send)
+            return
+        pin: Dict[str, float] = {}
+
+        async def send_with_pin(message) -> None:
+            if message["type"] == "http.response.start" and pin:
+                MutableHeaders(scope=message).append("set-cookie", read_pin_cookie(pin["until"]))
+            await send(message)
+
+        token = _WRITE_PIN.set(pin)
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            _WRITE_PIN.reset(token)
+
+
+def _to_user_id(v) -> Optional[int]:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _viewer_from_query(request: Request) -> Optional[int]:
+    q = request.query_params
+    user_id = _to_user_id(q.get("userId") or q.get("user1"))
+    return user_id if user_id is not None else peek_session_user_id(request)
+
+
+async def _viewer_from_request(request: Request) -> Optional[int]:
+    user_id = _viewer_from_query(request)
+    if user_id is not None:
+        return user_id
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()  # cached by starlette, the handler reads it again
+        except ValueError:
+            return None
+        if isinstance(body, dict):
+            return _to_user_id(body.get("userId"))
+    return None
+
 
 def get_db():
     db = SessionLocal()
@@ -20,3 +348,46 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_read_db(request: Request):
+    """Like get_db, but served by the replica when it is configured and healthy."""
+    db = None
+    if _use_replica(request, _viewer_from_query(request)):
+        db = ReplicaSessionLocal()
+        try:
+            db.connection()  # check out now so an unreachable replica falls back
+        except (SQLAlchemyError, OSError):
+            db.close()
+            _mark_replica_down()
+            db = None
+    if db is None:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    """Like get_async_db, but served by the replica when it is configured and healthy."""
+    db = None
+    if _use_replica(request, await _viewer_from_request(request)):
+        db = AsyncReplicaSessionLocal()
+        try:
+            await db.connection()  # check out now so an unreachable replica falls back
+        except (SQLAlchemyError, OSError):
+            await db.close()
+            _mark_replica_down()
+            db = None
+    if db is None:
+        db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
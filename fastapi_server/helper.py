@@ -1,6 +1,7 @@
 # helper.py
 from __future__ import annotations
 
+import base64
 import json
 import mimetypes
 from pathlib import Path
@@ -13,20 +14,55 @@ from models.chat_room import ChatRoom
 from models.user_blocks import UserBlock
 from models.user_likes  import UserLike
 from models.push_subscription import PushSubscription
-from passlib.context import CryptContext
-from sqlalchemy import and_, or_, select, exists, func
+from sqlalchemy import Integer, and_, any_, bindparam, or_, select, exists, func, lambda_stmt, literal, literal_column, tuple_, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import IntegrityError
 from cryptography.fernet import Fernet, InvalidToken
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from pywebpush import webpush, WebPushException
 from ws.notify import is_online
+from match_graph import mark_match_dirty
+from name_search import NAME_INDEX, escape_like, name_search_key
+from member_columns import MEMBER_COLUMNS
+from passwords import hash_password, verify_password_and_update
+from db import AsyncSessionLocal, mark_recent_write
+from sessions import PRINCIPALS, acting_user_id
+from block_cache import HIDDEN_PEERS
+from search_cache import (
+    SEARCH_CACHE, CandidateRows, SearchKey,
+    candidate_rows_from, epoch_us, from_epoch_us, member_snapshot, years_before,
+)
 from sendgrid_test.send_mail_verification import send_mail_verification
 import os
+import numpy as np
 
 def get_user(db: Session, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
 
 
+async def get_user_async(db: AsyncSession, user_id: int):
+    res = await db.execute(select(User).where(User.id == user_id))
+    return res.scalar_one_or_none()
+
+
+async def get_me(db: AsyncSession, session_uid: Optional[int], payload: Dict[str, Any]) -> User:
+    """
+    The calling member for /users and /search: session token (or legacy body
+    userId) -> PRINCIPALS cache -> users row. Read-only copy.
+    """
+    user_id = acting_user_id(session_uid, payload.get("userId"))
+    me = PRINCIPALS.get(user_id)
+    if me is not None:
+        return me
+    generation = PRINCIPALS.generation
+    user = await get_user_async(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return PRINCIPALS.put(user, generation)
+
+
 def get_user_by_email(db, c_email: str):
     user = db.query(User).filter(User.email == c_email).first()
     if not user:
@@ -34,19 +70,16 @@ def get_user_by_email(db, c_email: str):
     return user
 
 
-pwd_context = CryptContext(
-    schemes=["pbkdf2_sha256"],
-    deprecated="auto")
-
-def get_user_by_email_pass(db, c_email: str, password: str):
-    user = (
-        db.query(User)
-        .filter(User.email == c_email, User.is_email_verified.is_(True), or_(
+async def get_user_by_email_pass(db: AsyncSession, c_email: str, password: str):
+    res = await db.execute(
+        select(User)
+        .where(User.email == c_email, User.is_email_verified.is_(True), or_(
             User.isdeleted.is_(False),
             User.isdeleted.is_(None)
         ))
-        .first()
+        .limit(1)
     )
+    user = res.scalar_one_or_none()
 
     if not user:
         raise HTTPException(
@@ -54,16 +87,20 @@ def get_user_by_email_pass(db, c_email: str, password: str):
             detail="Bad credentials"
         )
 
-    if not pwd_context.verify(password, user.password_hash):
+    ok, new_hash = await verify_password_and_update(password, user.password_hash)
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Bad credentials"
         )
+    if new_hash:
+        # hash parameters were raised since this hash was made -> store the stronger one
+        user.password_hash = new_hash
 
     # ✅ Update last_seen_at
     user.last_seen_at = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     return user
 
@@ -87,12 +124,53 @@ def calc_age_py(day, month, year):
     return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
 
 
-def apply_user_filters(q, me):
-    q = q.filter(User.id != me.id)
+def select_users_stmt():
+    # base statement for the matching endpoints (/users, /search)
+    return lambda_stmt(lambda: select(User))
+
 
-    my_height = me.height
-    if my_height is not None and my_height > 0:
-        q = q.filter(
+def active_members_only(q):
+    # same predicate as the partial indexes on users
+    q += lambda s: s.where(
+        User.is_email_verified.is_(True),
+        User.isdeleted.is_not(True),
+        User.isfreezed.is_not(True),
+    )
+    return q
+
+
+def exclude_hidden_members(q, me_id: int):
+    # active members only, minus anyone I blocked or who blocked me (anti-joins on user_blocks)
+    q = active_members_only(q)
+    q += lambda s: s.where(
+        ~exists().where(UserBlock.user_id == me_id, UserBlock.blocked_user_id == User.id),
+        ~exists().where(UserBlock.user_id == User.id, UserBlock.blocked_user_id == me_id),
+    )
+    return q
+
+
+def searcher_attrs(me) -> Tuple[Optional[int], Optional[int], Optional[int], Optional[int]]:
+    # (height, age, ff, smoking) of the searcher, as the candidates' own filters see them
+    my_height = me.height if me.height is not None and me.height > 0 else None
+    my_age = calc_age_py(me.birth_day, me.birth_month, me.birth_year)
+    my_ff = int(me.ff) if me.ff is not None else None
+    my_smoking = int(me.smoking) if me.smoking is not None else None
+    return my_height, my_age, my_ff, my_smoking
+
+
+def apply_user_filters(q, me):
+    # q is a lambda_stmt: every value below is a closure variable, so SQLAlchemy
+    # caches the built + compiled statement per filter shape and only rebinds params
+    me_id = me.id
+    q += lambda s: s.where(User.id != me_id)
+    q = exclude_hidden_members(q, me_id)
+    return apply_member_filters(q, *searcher_attrs(me))
+
+
+def apply_member_filters(q, my_height, my_age, my_ff, my_smoking):
+    # the candidates' own height/age/family/smoking filters must accept the searcher
+    if my_height is not None:
+        q += lambda s: s.where(
           or_(
                 User.filter_height_min.is_(None),
                 User.filter_height_max.is_(None),
@@ -106,9 +184,8 @@ def apply_user_filters(q, me):
        pass
     
 
-    my_age = calc_age_py(me.birth_day, me.birth_month, me.birth_year)
     if my_age is not None:
-       q = q.filter(
+       q += lambda s: s.where(
          or_(
            User.filter_age_min.is_(None),
            User.filter_age_max.is_(None),
@@ -121,27 +198,18 @@ def apply_user_filters(q, me):
     else:
        pass
     
-    my_ff = me.ff
     if my_ff is not None:
-        q = q.filter(
-            or_(
-                User.filter_family_status.is_(None),     # no filter
-                User.filter_family_status == "",         # no filter (if you store empty string)
-                User.filter_family_status == "0",        # no filter (if you use "0" meaning all)
-                ("," + User.filter_family_status + ",").contains(f",{int(my_ff)},")
-            )
+        ff_any = [0, my_ff]  # 0 = no filter
+        q += lambda s: s.where(
+            User.filter_family_status.overlap(ff_any)   # GIN: filter && {0, my_ff}
         )
     else:
         pass
     
-    my_smoking = me.smoking
     if my_smoking is not None:
-        q = q.filter(
-            or_(
-                User.filter_smoking_status.is_(None),           # no filter
-                User.filter_smoking_status == "0",              # no filter
-                User.filter_smoking_status == str(int(my_smoking)),
-            )
+        smoking_any = [0, my_smoking]  # 0 = no filter
+        q += lambda s: s.where(
+            User.filter_smoking_status.in_(smoking_any)
         )
     else:
         pass
@@ -150,12 +218,79 @@ def apply_user_filters(q, me):
     return q
 
 
-def hash_password(raw: str) -> str:
-    return pwd_context.hash(raw)
+####################################################################
+# Keyset paging for /users and /search: newest first, (created_at, id)
+USERS_PAGE_MAX = 200
+
+
+def encode_user_cursor(user: User) -> str:
+    return encode_keyset_cursor(user.created_at, user.id)
+
+
+def encode_keyset_cursor(created_at: datetime, user_id: int) -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "id": user_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
 
-def upsert_user(db: Session, user_fields: Dict[str, Any]) -> Tuple[User, bool]:
+def decode_user_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["t"]), int(raw["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def fetch_user_page(db: AsyncSession, q, cursor: Optional[str], limit: Any) -> Dict[str, Any]:
+    """
+    Run a matching lambda_stmt one page at a time.
+    Returns {"items": [...], "next_cursor": str | None}.
     """
-    Upsert by email (SYNC):
+    page_limit = min(max(to_int(limit) or 50, 1), USERS_PAGE_MAX)
+
+    if cursor:
+        after_at, after_id = decode_user_cursor(cursor)
+        q += lambda s: s.where(
+            tuple_(User.created_at, User.id) < tuple_(after_at, after_id)
+        )
+
+    fetch = page_limit + 1  # one extra row tells us if there is a next page
+    q += lambda s: s.order_by(User.created_at.desc(), User.id.desc()).limit(fetch)
+
+    rows = (await db.execute(q)).scalars().all()
+    items = rows[:page_limit]
+    next_cursor = encode_user_cursor(items[-1]) if len(rows) > page_limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+# columns a listing card needs (created_at: keyset cursor, image_path: has_image)
+CARD_COLUMNS = (
+    User.id, User.name, User.gender,
+    User.birth_day, User.birth_month, User.birth_year,
+    User.country, User.image_path, User.last_seen_at, User.created_at,
+)
+
+
+def apply_card_view(q):
+    # load only the card columns (no details/details1, extra_images, filters...)
+    return q + (lambda s: s.options(load_only(*CARD_COLUMNS)))
+
+
+def to_status_ids(csv: Optional[str]) -> List[int]:
+    """
+    "1,2,3" (as sent by the register form) -> [1, 2, 3].
+    Empty / "0" / garbage -> [0] (no filter).
+    """
+    ids: List[int] = []
+    for part in (csv or "").split(","):
+        v = to_int(part.strip())
+        if v and v not in ids:
+            ids.append(v)
+    return sorted(ids) or [0]
+
+
+async def upsert_user(db: AsyncSession, user_fields: Dict[str, Any]) -> Tuple[User, bool]:
+    """
+    Upsert by email (ASYNC):
     - if email exists -> update (EXCEPT password/password2)
     - else -> insert (can include password/password2)
     Returns: (user, created: bool)
@@ -172,8 +307,9 @@ def upsert_user(db: Session, user_fields: Dict[str, Any]) -> Tuple[User, bool]:
 
     # find existing user by email
     stmt = select(User).where(User.email == email)
-    res = db.execute(stmt)
+    res = await db.execute(stmt)
     user = res.scalar_one_or_none()
+    before = member_snapshot(user) if user is not None else None
 
     if user is None:
         # INSERT
@@ -182,7 +318,7 @@ def upsert_user(db: Session, user_fields: Dict[str, Any]) -> Tuple[User, bool]:
         if not raw_password:
             raise ValueError("password is required when creating a user")
 
-        data["password_hash"] = hash_password(raw_password)
+        data["password_hash"] = await hash_password(raw_password)
         data["isfreezed"] = False
         data["isdeleted"] = False
         data["is_email_verified"] = False
@@ -205,9 +341,16 @@ def upsert_user(db: Session, user_fields: Dict[str, Any]) -> Tuple[User, bool]:
 
         created = False
 
-    db.commit()
-    db.refresh(user)
-    send_mail_verification(email, encrypt_uid(user.id))   
+    await db.commit()
+    await db.refresh(user)
+    mark_match_dirty(user.id)
+    NAME_INDEX.sync_user(user)
+    MEMBER_COLUMNS.sync_user(user)
+    PRINCIPALS.invalidate(user.id)
+    mark_recent_write(user.id)
+    SEARCH_CACHE.invalidate_member(before, member_snapshot(user))
+    # SMTP session is blocking -> keep it off the event loop
+    await run_in_threadpool(send_mail_verification, email, encrypt_uid(user.id))
     return user, created
 
 ####################################################################
@@ -229,6 +372,7 @@ def block_user(db: Session, user_id, blocked_user_id):
         # delete (toggle off)
         db.delete(existing)
         db.commit()
+        HIDDEN_PEERS.invalidate(user_id, blocked_user_id)
         return {"blocked": False}
     else:
         # insert (toggle on)
@@ -238,8 +382,7 @@ def block_user(db: Session, user_id, blocked_user_id):
         except IntegrityError:
             # In case of race condition (two requests at once)
             db.rollback()
-            return {"blocked": True}
-
+        HIDDEN_PEERS.invalidate(user_id, blocked_user_id)
         return {"blocked": True}
 
 
@@ -280,20 +423,50 @@ def like_user(db: Session, user_id, liked_user_id):
 
         return {"liked": True}
         
+####################################################################
+RELATIONSHIP_FLAGS = ("liked", "likedMe", "blocked", "blockedMe")
+
+
+def get_relationship_states(
+    db: Session,
+    user_id: int,
+    peer_ids: List[int],
+) -> Dict[int, Dict[str, bool]]:
+    """
+    Like/block state between user_id and every peer, in one set-based query:
+      liked     - user_id liked peer
+      likedMe   - peer liked user_id
+      blocked   - user_id blocked peer
+      blockedMe - peer blocked user_id
+    """
+    peer_ids = list(dict.fromkeys(int(pid) for pid in peer_ids))  # keyed like the DB rows
+    states = {pid: {flag: False for flag in RELATIONSHIP_FLAGS} for pid in peer_ids}
+    if not peer_ids:
+        return states
+
+    stmt = union_all(
+        select(UserLike.liked_user_id, literal("liked"))
+        .where(UserLike.user_id == user_id, UserLike.liked_user_id.in_(peer_ids)),
+        select(UserLike.user_id, literal("likedMe"))
+        .where(UserLike.liked_user_id == user_id, UserLike.user_id.in_(peer_ids)),
+        select(UserBlock.blocked_user_id, literal("blocked"))
+        .where(UserBlock.user_id == user_id, UserBlock.blocked_user_id.in_(peer_ids)),
+        select(UserBlock.user_id, literal("blockedMe"))
+        .where(UserBlock.blocked_user_id == user_id, UserBlock.user_id.in_(peer_ids)),
+    )
+
+    for peer_id, flag in db.execute(stmt):
+        states[peer_id][flag] = True
+    return states
+
 ####################################################################
 def is_user_blocked(
     db: Session,
     user_id: int,
     peer_id: int,
 ) -> bool:
-    stmt = select(
-        exists().where(
-            (UserBlock.user_id == user_id) &
-            (UserBlock.blocked_user_id == peer_id)
-        )
-    )
-
-    return db.execute(stmt).scalar()
+    peer_id = int(peer_id)
+    return get_relationship_states(db, user_id, [peer_id])[peer_id]["blocked"]
 
 ####################################################################
 def is_user_liked(
@@ -301,72 +474,341 @@ def is_user_liked(
     user_id: int,
     peer_id: int,
 ) -> bool:
-    stmt = select(
-        exists().where(
-            (UserLike.user_id == user_id) &
-            (UserLike.liked_user_id == peer_id)
-        )
-    )
-
-    return db.execute(stmt).scalar()
+    peer_id = int(peer_id)
+    return get_relationship_states(db, user_id, [peer_id])[peer_id]["liked"]
 
 ####################################################################
 def search_user(
-    db: Session,
     c_gender, c_ff, c_country, c_smoking,
-    c_tz, c_pic, c_ages1, c_ages2, c_name
+    c_tz, c_pic, c_ages1, c_ages2, c_name, base=None
 ):
-    query = db.query(User)
+    # returns a lambda_stmt (see apply_user_filters); caller executes it
+    query = base if base is not None else select_users_stmt()
 
     if c_gender not in (None, 9, "9"):
-        query = query.filter(User.gender == int(c_gender))
+        gender = int(c_gender)
+        query += lambda s: s.where(User.gender == gender)
 
     if c_ff not in (None, 9, "9"):
-        query = query.filter(User.ff == int(c_ff))
+        ff = int(c_ff)
+        query += lambda s: s.where(User.ff == ff)
 
     if c_country not in (None, 0, "0"):
-        query = query.filter(User.country == int(c_country))
+        country = int(c_country)
+        query += lambda s: s.where(User.country == country)
 
     if c_smoking:
-        query = query.filter(User.smoking == int(c_smoking))
+        smoking = int(c_smoking)
+        query += lambda s: s.where(User.smoking == smoking)
 
     if c_tz not in (None, 0, "0"):
-        query = query.filter(User.c_tz == int(c_tz))
+        tz = int(c_tz)
+        query += lambda s: s.where(User.c_tz == tz)
 
     if c_pic:
-        query = query.filter(
+        query += lambda s: s.where(
             User.image_path.is_not(None),
             User.image_path != ""
         )
 
     if c_ages1 or c_ages2:
-        current_year = date.today().year
+        today = date.today()
         min_age = int(c_ages1 or 0)
         max_age = int(c_ages2 or 0)
 
-        query = query.filter(
-            User.birth_year.is_not(None),
-            User.birth_year > 0
+        # exact age on the indexed birth_date column (NULL = no valid birth date)
+        query += lambda s: s.where(
+            User.birth_date.is_not(None)
         )
 
         if min_age:
-            query = query.filter(
-                User.birth_year <= current_year - min_age
+            # age >= min_age  <=>  born on/before today minus min_age years
+            latest_birth = years_before(today, min_age)
+            query += lambda s: s.where(
+                User.birth_date <= latest_birth
             )
         if max_age:
-            query = query.filter(
-                User.birth_year >= current_year - max_age
+            # age <= max_age  <=>  born after today minus (max_age + 1) years
+            earliest_birth = years_before(today, max_age + 1)
+            query += lambda s: s.where(
+                User.birth_date > earliest_birth
             )
 
     if c_name not in (None, 0, "0"):
-        name = str(c_name).strip()
-        if name:
-            query = query.filter(
-                User.name.ilike(f"%{name}%")
+        name_key = name_search_key(str(c_name))
+        if name_key:
+            name_pattern = f"%{escape_like(name_key)}%"
+            # substring or trigram-similar, both served by the name_search GIN index
+            query += lambda s: s.where(
+                or_(
+                    User.name_search.like(name_pattern, escape="/"),
+                    User.name_search.bool_op("%")(name_key),
+                )
             )
 
     return query
 
+
+def rank_by_name(query, c_name):
+    # best name matches first (use only on unpaged results: paging orders by (created_at, id))
+    name_key = name_search_key(str(c_name or ""))
+    if not name_key or c_name in (0, "0"):
+        return query
+    return query + (lambda s: s.order_by(func.similarity(User.name_search, name_key).desc()))
+
+
+####################################################################
+# /search through the shared result cache (search_cache.py)
+def search_cache_key(payload: Dict[str, Any], me, ranked: bool) -> SearchKey:
+    """Normalize the /search filters the same way search_user() reads them."""
+    c_gender = payload.get("c_gender")
+    c_ff = payload.get("c_ff")
+    c_country = payload.get("c_country")
+    c_smoking = payload.get("c_smoking")
+    c_tz = payload.get("c_tz")
+    c_name = payload.get("c_name")
+    name_key = name_search_key(str(c_name)) if c_name not in (None, 0, "0") else ""
+    my_height, my_age, my_ff, my_smoking = searcher_attrs(me)
+    return SearchKey(
+        gender=int(c_gender) if c_gender not in (None, 9, "9") else None,
+        ff=int(c_ff) if c_ff not in (None, 9, "9") else None,
+        country=int(c_country) if c_country not in (None, 0, "0") else None,
+        smoking=int(c_smoking) if c_smoking else None,
+        tz=int(c_tz) if c_tz not in (None, 0, "0") else None,
+        pic=bool(payload.get("c_pic")),
+        min_age=int(payload.get("c_ages1") or 0),
+        max_age=int(payload.get("c_ages2") or 0),
+        name_key=name_key,
+        my_height=my_height,
+        my_age=my_age,
+        my_ff=my_ff,
+        my_smoking=my_smoking,
+        ranked=ranked and bool(name_key),
+    )
+
+
+def search_candidates_stmt(key: SearchKey):
+    # id-only /search statement for a cache miss (lambda_stmt, cached per filter shape)
+    q = search_user(
+        key.gender, key.ff, key.country, key.smoking,
+        key.tz, key.pic, key.min_age, key.max_age, key.name_key,
+        base=lambda_stmt(lambda: select(User.id, User.created_at)),
+    )
+    q = active_members_only(q)
+    q = apply_member_filters(q, key.my_height, key.my_age, key.my_ff, key.my_smoking)
+    if key.ranked:
+        q = rank_by_name(q, key.name_key)
+    else:
+        q += lambda s: s.order_by(User.created_at.desc(), User.id.desc())
+    return q
+
+
+async def search_candidate_rows(db: AsyncSession, key: SearchKey) -> CandidateRows:
+    """
+    Ordered (id, created_at) of every active member matching key, from
+    SEARCH_CACHE, else the MEMBER_COLUMNS masks, else one id-only query
+    (then cached). Does not exclude the searcher or blocks - see hidden_peer_ids().
+    """
+    rows = SEARCH_CACHE.get(key)
+    if rows is not None:
+        return rows
+
+    generation = SEARCH_CACHE.generation
+    if MEMBER_COLUMNS.ready and MEMBER_COLUMNS.supports(key):
+        rows = MEMBER_COLUMNS.candidates(key)
+        SEARCH_CACHE.put(key, rows, generation)
+        return rows
+
+    rows = candidate_rows_from((await db.execute(search_candidates_stmt(key))).all())
+    SEARCH_CACHE.put(key, rows, generation)
+    return rows
+
+
+def matching_key(me) -> SearchKey:
+    # /users: no search filters, only the candidates' own filters against me
+    my_height, my_age, my_ff, my_smoking = searcher_attrs(me)
+    return SearchKey(
+        gender=None, ff=None, country=None, smoking=None, tz=None,
+        pic=False, min_age=0, max_age=0, name_key="",
+        my_height=my_height, my_age=my_age, my_ff=my_ff, my_smoking=my_smoking,
+        ranked=False,
+    )
+
+
+async def liked_peer_ids(db: AsyncSession, me_id: int, liked_me: bool) -> set[int]:
+    # liked_me: members who liked me, else members I liked
+    if liked_me:
+        q = select(UserLike.user_id).where(UserLike.liked_user_id == me_id)
+    else:
+        q = select(UserLike.liked_user_id).where(UserLike.user_id == me_id)
+    return set((await db.execute(q)).scalars().all())
+
+
+async def hidden_peer_ids(db: AsyncSession, me_id: int) -> set[int]:
+    # me + anyone I blocked or who blocked me
+    res = await db.execute(union_all(
+        select(UserBlock.blocked_user_id).where(UserBlock.user_id == me_id),
+        select(UserBlock.user_id).where(UserBlock.blocked_user_id == me_id),
+    ))
+    hidden = set(res.scalars().all())
+    hidden.add(me_id)
+    return hidden
+
+
+def _id_array(ids: set[int]) -> np.ndarray:
+    return np.fromiter(ids, np.int32, len(ids))
+
+
+def visible_ids(rows: CandidateRows, hidden: set[int]) -> List[int]:
+    """Every id of rows not in hidden, in order (unpaged responses / facets)."""
+    ids = rows.ids
+    if hidden:
+        ids = ids[~np.isin(ids, _id_array(hidden))]
+    return ids.tolist()
+
+
+def _keyset_start(rows: CandidateRows, after_us: int, after_id: int) -> int:
+    # first index past (after_us, after_id) in newest-first rows, by binary search
+    n = len(rows.ids)
+    asc = rows.created_us[::-1]  # view, ascending
+    lo = n - int(np.searchsorted(asc, after_us, side="right"))  # first created <= after
+    hi = n - int(np.searchsorted(asc, after_us, side="left"))   # first created < after
+    same = rows.ids[lo:hi][::-1]  # ties on created_at, ids ascending
+    return lo + (hi - lo) - int(np.searchsorted(same, after_id, side="left"))
+
+
+async def cached_hidden_peer_ids(me_id: int) -> frozenset[int]:
+    """hidden_peer_ids() through HIDDEN_PEERS; opens a session only on a miss."""
+    hidden = HIDDEN_PEERS.get(me_id)
+    if hidden is not None:
+        return hidden
+    generation = HIDDEN_PEERS.generation
+    async with AsyncSessionLocal() as db:
+        return HIDDEN_PEERS.put(me_id, await hidden_peer_ids(db, me_id), generation)
+
+
+def page_candidate_rows(
+    rows: CandidateRows, hidden: set[int], cursor: Optional[str], limit: Any
+) -> Tuple[List[int], Optional[str]]:
+    """One keyset page over cached newest-first rows -> (ids, next_cursor)."""
+    page_limit = min(max(to_int(limit) or 50, 1), USERS_PAGE_MAX)
+    start = 0
+    if cursor:
+        after_at, after_id = decode_user_cursor(cursor)
+        start = _keyset_start(rows, epoch_us(after_at), after_id)
+
+    # hidden can knock out at most len(hidden) rows of the window
+    end = start + page_limit + 1 + len(hidden)
+    window = np.arange(start, min(end, len(rows.ids)))
+    if hidden:
+        window = window[~np.isin(rows.ids[window], _id_array(hidden))]
+    page = window[:page_limit]
+    ids = rows.ids[page].tolist()
+    if len(window) <= page_limit:
+        return ids, None
+    last = page[-1]
+    return ids, encode_keyset_cursor(from_epoch_us(rows.created_us[last]), int(rows.ids[last]))
+
+
+def page_ranked_rows(
+    rows: CandidateRows, hidden: set[int], cursor: Optional[str], limit: Any
+) -> Tuple[List[int], Optional[str]]:
+    """One page over score-ranked rows -> (ids, next_cursor). Scores move between
+    requests (online state, last_seen_at), so the cursor is a plain offset."""
+    page_limit = min(max(to_int(limit) or 50, 1), USERS_PAGE_MAX)
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    ids = rows.ids
+    if hidden:
+        ids = ids[~np.isin(ids, _id_array(hidden))]
+    end = offset + page_limit
+    return ids[offset:end].tolist(), encode_offset_cursor(end) if len(ids) > end else None
+
+
+def encode_offset_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode()
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["o"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+
+async def load_users_by_ids(db: AsyncSession, ids: List[int], card: bool = False) -> List[User]:
+    # one primary-key lookup, rows returned in the order of ids
+    if not ids:
+        return []
+    q = select(User).where(User.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
+    if card:
+        q = q.options(load_only(*CARD_COLUMNS))
+    by_id = {u.id: u for u in (await db.execute(q)).scalars().all()}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+async def search_facets(db: AsyncSession, ids: List[int]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Bucket counts over a /search result set, one GROUPING SETS query:
+    {"country": [{"value": 3, "count": 120}, ...], "ff": [...], "smoking": [...],
+     "gender": [...], "has_picture": [{"value": True, "count": 80}, ...]}
+    """
+    # literal '' (not a bind param) so the expression is identical in SELECT and GROUP BY
+    has_picture = and_(User.image_path.is_not(None), User.image_path != literal_column("''"))
+    dims = {
+        "country": User.country,
+        "ff": User.ff,
+        "smoking": User.smoking,
+        "gender": User.gender,
+        "has_picture": has_picture,
+    }
+    facets: Dict[str, List[Dict[str, Any]]] = {name: [] for name in dims}
+    if not ids:
+        return facets
+
+    exprs = list(dims.values())
+    res = await db.execute(
+        select(*exprs, func.grouping(*exprs).label("g"), func.count().label("n"))
+        .where(User.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
+        .group_by(func.grouping_sets(*(tuple_(e) for e in exprs)))
+    )
+
+    # grouping() sets bit (len - 1 - i) when dims[i] is NOT part of the row's set
+    names = list(dims)
+    width = len(names)
+    for row in res.all():
+        for i, name in enumerate(names):
+            if not row.g & (1 << (width - 1 - i)):
+                facets[name].append({"value": row[i], "count": row.n})
+                break
+    for buckets in facets.values():
+        buckets.sort(key=lambda b: b["count"], reverse=True)
+    return facets
+
+
+async def warm_matching_statements(db: AsyncSession) -> None:
+    """
+    Run the common /users and /search shapes once at startup so the SQLAlchemy
+    compiled cache and the asyncpg prepared-statement cache are already filled.
+    Streams and stops after the first row, so it never loads the table.
+    """
+    me = User(id=0, height=170, birth_day=1, birth_month=1, birth_year=1990, ff=1, smoking=1)
+    mine = matching_key(me)
+    shapes = [
+        # /users without member columns / match graph
+        apply_user_filters(select_users_stmt(), me),
+        # /search cache misses (search_candidate_rows): no filters, gender + age, name
+        search_candidates_stmt(mine),
+        search_candidates_stmt(mine._replace(gender=1, min_age=30, max_age=40)),
+        search_candidates_stmt(mine._replace(name_key=name_search_key("dana"))),
+        search_candidates_stmt(mine._replace(name_key=name_search_key("dana"), ranked=True)),
+    ]
+    for stmt in shapes:
+        res = await db.stream(stmt)
+        await res.first()
+
 ####################################################################
 def freeze_user_db(db: Session, user_id: int) -> User:
     user = db.query(User).filter(User.id == user_id).first()
@@ -374,10 +816,16 @@ def freeze_user_db(db: Session, user_id: int) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    before = member_snapshot(user)
     user.isfreezed = not user.isfreezed
 
     db.commit()
     db.refresh(user)
+    NAME_INDEX.sync_user(user)
+    MEMBER_COLUMNS.sync_user(user)
+    PRINCIPALS.invalidate(user.id)
+    mark_recent_write(user.id)
+    SEARCH_CACHE.invalidate_member(before, member_snapshot(user))
 
     return user
 
@@ -388,10 +836,16 @@ def delete_user_db(db: Session, user_id: int) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    before = member_snapshot(user)
     user.isdeleted = True
 
     db.commit()
     db.refresh(user)
+    NAME_INDEX.sync_user(user)
+    MEMBER_COLUMNS.sync_user(user)
+    PRINCIPALS.invalidate(user.id)
+    mark_recent_write(user.id)
+    SEARCH_CACHE.invalidate_member(before, member_snapshot(user))
 
     return user
 
@@ -401,9 +855,15 @@ def set_email_verified(db: Session, user_id: int) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    before = member_snapshot(user)
     user.is_email_verified = True
     db.commit()
     db.refresh(user)
+    NAME_INDEX.sync_user(user)
+    MEMBER_COLUMNS.sync_user(user)
+    PRINCIPALS.invalidate(user.id)
+    mark_recent_write(user.id)
+    SEARCH_CACHE.invalidate_member(before, member_snapshot(user))
     return user
 
 
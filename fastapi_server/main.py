@@ -7,11 +7,13 @@ import mimetypes
 import os
 import uuid
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import exists,and_
+from sqlalchemy.orm import Session
+from sqlalchemy import exists,and_,select
 import uvicorn
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile, Query, Body, Depends
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile, Query, Body, Depends, Request, Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.encoders import jsonable_encoder
@@ -25,11 +27,12 @@ from helper import decrypt_uid
 # import routers
 from routes.sms_updates import router2 as sms_updates_router
 from routes.push import router3 as push_router
-from ws.notify import router as notify_router
+from ws.notify import router as notify_router, online_user_ids, flush_last_seen, start_last_seen_worker
 from ws.chat import router as chat_router
 from routes.admin_updates import admin_updates_router
 from routes.admin_pages import public_pages_router,admin_pages_router
 from routes.admin_users import admin_users_router
+from routes.admin_db import admin_db_router
 from routes.admin_banners import admin_banners_router
 from routes.mail_sender import mail_sender_router
 
@@ -52,15 +55,33 @@ from helper import (
     save_messages,
     pass_filter,
     get_user,
+    get_me,
     get_system_chat_rooms,
     get_user_by_email_pass,
     apply_user_filters,
+    exclude_hidden_members,
+    select_users_stmt,
+    fetch_user_page,
+    apply_card_view,
+    to_status_ids,
+    warm_matching_statements,
     get_user_by_email,
     hash_password,
     block_user,
     is_user_blocked,
     is_user_liked,
-    search_user,
+    get_relationship_states,
+    search_cache_key,
+    search_candidate_rows,
+    hidden_peer_ids,
+    cached_hidden_peer_ids,
+    page_candidate_rows,
+    page_ranked_rows,
+    visible_ids,
+    load_users_by_ids,
+    matching_key,
+    liked_peer_ids,
+    search_facets,
     like_user,
     freeze_user_db,
     delete_user_db,
@@ -69,8 +90,16 @@ from helper import (
 
 from sendgrid_test.send_mail import send_mail
 from schemas.chat_room import ChatRoomOut2
-from schemas.user import UserBase
-from db import get_db
+from schemas.user import UserBase, UserCard, UserCardPage, UserPage
+from name_search import NAME_INDEX, start_name_index
+from admission import LOGIN_ADMISSION, FORGOT_PASS_ADMISSION, RESET_PASSWORD_ADMISSION
+from sessions import acting_user_id, issue_session_token, session_user_id, set_session_cookie
+from member_columns import MEMBER_COLUMNS, start_member_columns
+from match_graph import is_match_graph_fresh, select_matches_stmt, start_match_graph_worker
+from db import (
+    AsyncSessionLocal, ReadPinMiddleware, get_db, get_async_db, get_read_db, get_async_read_db,
+    mark_recent_write,
+)
 from models.user import User
 from models.chat_message import ChatMessage
 from models.user_likes import UserLike
@@ -114,6 +143,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# read-your-writes across workers (db.py)
+app.add_middleware(ReadPinMiddleware)
 
 app.include_router(notify_router)
 app.include_router(chat_router)
@@ -123,10 +154,38 @@ app.include_router(admin_updates_router)
 app.include_router(public_pages_router)
 app.include_router(admin_pages_router)
 app.include_router(admin_users_router)
+app.include_router(admin_db_router)
 app.include_router(admin_banners_router)
 app.include_router(mail_sender_router, prefix="/api")
 
 
+@app.on_event("startup")
+async def warm_query_caches() -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            await warm_matching_statements(db)
+    except Exception as e:
+        # warm-up is best effort; never block the server from starting
+        log.warning("Matching query warm-up failed: %s", e)
+
+
+@app.on_event("startup")
+async def start_background_workers() -> None:
+    start_match_graph_worker()
+    start_last_seen_worker()
+    await start_name_index()
+    await start_member_columns()
+
+
+@app.on_event("shutdown")
+async def flush_presence() -> None:
+    # don't lose up to LAST_SEEN_FLUSH_SEC of heartbeats on restart
+    try:
+        await flush_last_seen()
+    except Exception:
+        log.exception("Final last_seen_at flush failed")
+
+
 # ---------------------------------------------------------------------
 # Locks
 # ---------------------------------------------------------------------
@@ -304,7 +363,7 @@ async def delete_user_extra_image(user_id: int, filename: str, db: AsyncSession
 
 @app.post("/register")
 async def register(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 
     c_name: str = Form(...),
     c_gender: str = Form(...),
@@ -396,14 +455,14 @@ async def register(
         "filter_height_max": to_int(filter_height_max),
         "filter_age_min": to_int(filter_age_min),
         "filter_age_max": to_int(filter_age_max),
-        "filter_family_status": filter_family_status,          # CSV like "1,2,3"
-        "filter_smoking_status": str(filter_smoking_status),   # keep as string if column is string
+        "filter_family_status": to_status_ids(filter_family_status),   # CSV like "1,2,3" -> [1, 2, 3]
+        "filter_smoking_status": to_int(filter_smoking_status) or 0,   # 0 = no filter
     
         "notify_push": to_bool(notify_push),
         "notify_email": to_bool(notify_email),
     }
 
-    stored_user, created = upsert_user(db, user_fields)
+    stored_user, created = await upsert_user(db, user_fields)
     user_id = stored_user.id
 
     # -------------------------
@@ -426,8 +485,8 @@ async def register(
         stored_user.image_content_type = c_image.content_type
         stored_user.image_size = image_size
 
-        db.commit()
-        db.refresh(stored_user)
+        await db.commit()
+        await db.refresh(stored_user)
 
         log.info("Upserted user (with profile image): email=%s userID=%s image=%s",
                  stored_user.email, user_id, image_rel_path)
@@ -475,8 +534,8 @@ async def register(
             # ✅ ORM attribute (JSONB column)
             stored_user.extra_images = existing + new_meta
 
-            db.commit()
-            db.refresh(stored_user)
+            await db.commit()
+            await db.refresh(stored_user)
 
             log.info("Appended %d extra images (total=%d): email=%s userID=%s",
                      len(new_meta), len(stored_user.extra_images or []),
@@ -504,45 +563,139 @@ async def register(
     })
 
 
-@app.post("/users", response_model=list[UserBase])
-async def get_users(payload: dict = Body(...), db: Session = Depends(get_db)):
-    # accept either userId or userid
-    user_id = payload.get("userId")
-    if not user_id:
-        raise HTTPException(status_code=400, detail="Missing userId")
+def is_paged_request(payload: Dict[str, Any]) -> bool:
+    return payload.get("limit") is not None or bool(payload.get("cursor"))
 
-    me = db.query(User).filter(User.id == int(user_id)).first()
-    if not me:
-        raise HTTPException(status_code=404, detail="User not found")
 
-    q = db.query(User)
-    q = apply_user_filters(q, me)
+async def user_list_response(db: AsyncSession, q, payload: Dict[str, Any]):
+    """
+    Shared tail of /users and /search.
+    - {"limit", "cursor"} -> one keyset page {items, next_cursor}, else the full list
+    - {"view": "card"}    -> only the listing-card columns (UserCard)
+    """
+    card = payload.get("view") == "card"
+    if card:
+        q = apply_card_view(q)
+
+    paged = is_paged_request(payload)
+    if paged:
+        page = await fetch_user_page(db, q, payload.get("cursor"), payload.get("limit"))
+    else:
+        page = {"items": (await db.execute(q)).scalars().all(), "next_cursor": None}
+    return shape_user_list(page["items"], page["next_cursor"], paged, card)
+
+
+async def candidate_list_response(
+    db: AsyncSession, rows, hidden: set, payload: Dict[str, Any],
+    with_facets: bool = False, ranked: bool = False,
+):
+    """
+    Tail of /users and /search when the candidates are already known as ordered
+    CandidateRows (search cache / member columns): page, hydrate by id.
+    ranked: rows are score-ordered (offset cursor), else newest first (keyset cursor).
+    """
+    paged = is_paged_request(payload)
+    visible = visible_ids(rows, hidden) if with_facets or not paged else None
+    if paged:
+        pager = page_ranked_rows if ranked else page_candidate_rows
+        ids, next_cursor = pager(rows, hidden, payload.get("cursor"), payload.get("limit"))
+    else:
+        ids, next_cursor = visible, None
+
+    # facets -> bucket counts over the whole result set, not just this page
+    facets = await search_facets(db, visible) if with_facets else None
+
+    card = payload.get("view") == "card"
+    items = await load_users_by_ids(db, ids, card=card)
+    return shape_user_list(items, next_cursor, paged, card, facets)
+
+
+def shape_user_list(
+    items: List[User], next_cursor: Optional[str], paged: bool, card: bool,
+    facets: Optional[Dict[str, Any]] = None,
+):
+    # facets need an object around the list, so they force the page shape
+    paged = paged or facets is not None
+    if card:
+        # bypass response_model: a card must not be re-validated as a full UserBase
+        cards = [UserCard.model_validate(u) for u in items]
+        content = UserCardPage(items=cards, next_cursor=next_cursor, facets=facets) if paged else cards
+        return JSONResponse(jsonable_encoder(content))
+    if paged:
+        return {"items": items, "next_cursor": next_cursor, "facets": facets}
+    return items
+
+
+@app.post("/users", response_model=Union[list[UserBase], UserPage])
+async def get_users(
+    response: Response,
+    payload: dict = Body(...),
+    session_uid: Optional[int] = Depends(session_user_id),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    me = await get_me(db, session_uid, payload)
 
     onlyUsersThatLikedMe = payload.get("onlyUsersThatLikedMe")
+    me_id = me.id
+    # "best" (default): compatibility-ranked, "newest": created_at desc
+    best = payload.get("sort", "best") != "newest"
+
+    if MEMBER_COLUMNS.serves_users_feed(best, is_match_graph_fresh(me_id)):
+        response.headers["X-Feed-Order"] = "best" if best else "newest"
+        # in-process column masks (member_columns.py), Postgres only hydrates the page
+        liked_me = await liked_peer_ids(db, me_id, liked_me=True) if best or onlyUsersThatLikedMe is True else set()
+        only = None
+        if onlyUsersThatLikedMe is True:
+            only = liked_me
+        elif onlyUsersThatLikedMe is False:
+            only = await liked_peer_ids(db, me_id, liked_me=False)
+        hidden = await hidden_peer_ids(db, me_id)
+        if best:
+            # scoring is whole-array NumPy work (releases the GIL): off the event loop
+            rows = await run_in_threadpool(
+                MEMBER_COLUMNS.ranked_candidates,
+                matching_key(me), me, exclude=hidden, only=only,
+                online=online_user_ids(), liked_me=liked_me,
+            )
+        else:
+            rows = MEMBER_COLUMNS.candidates(matching_key(me), exclude=hidden, only=only)
+        return await candidate_list_response(db, rows, set(), payload, ranked=best)
+
+    # newest first from here on; a "best" request says so instead of passing as ranked
+    response.headers["X-Feed-Order"] = "newest"
+    if best:
+        MEMBER_COLUMNS.note_unranked_fallback()
+
+    if is_match_graph_fresh(me.id):
+        # precomputed pairs: plain index lookup on user_matches
+        q = exclude_hidden_members(select_matches_stmt(me.id), me.id)
+    else:
+        # no snapshot yet -> live filters in SQL
+        q = apply_user_filters(select_users_stmt(), me)
     
     #if  onlyUsersThatLikedMe is None , there is no filter
 
     if onlyUsersThatLikedMe is True: 
-      q = q.filter(
+      q += lambda s: s.where(
         exists().where(
             and_(
                 UserLike.user_id == User.id,
-                UserLike.liked_user_id == me.id
+                UserLike.liked_user_id == me_id
             )
         )
       )
     
     elif onlyUsersThatLikedMe is False:
-      q = q.filter(
+      q += lambda s: s.where(
         exists().where(
             and_(
-                UserLike.user_id == me.id,
+                UserLike.user_id == me_id,
                 UserLike.liked_user_id == User.id
             )
         )
       )
-     
-    return q.all()
+
+    return await user_list_response(db, q, payload)
     '''
     ensure_data_file(DATA_DIR, USERS_PATH)
     async with users_lock:
@@ -557,13 +710,19 @@ async def get_users(payload: dict = Body(...), db: Session = Depends(get_db)):
 
 @app.post("/login", response_model=UserBase)
 async def login(
+    request: Request,
+    response: Response,
     c_email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     
     c_email = (c_email or "").strip().lower()
-    return get_user_by_email_pass(db, c_email, password)
+    async with LOGIN_ADMISSION.admit(request, c_email):
+        user = await get_user_by_email_pass(db, c_email, password)
+    # signed session (sessions.py): later calls skip the userId lookup
+    set_session_cookie(response, issue_session_token(user.id))
+    return user
 
     '''
     email = (c_email or "").strip().lower()
@@ -588,15 +747,18 @@ async def login(
 
 @app.post("/forgotPass")
 async def forgot_pass(
+    request: Request,
     c_email: str = Form(...),
     db: Session = Depends(get_db)
 ):
 
     email = (c_email or "").strip().lower()    
-    user = get_user_by_email(db,email)
+    async with FORGOT_PASS_ADMISSION.admit(request, email):
+        user = get_user_by_email(db,email)
 
-    uid = user.id
-    return send_mail(email, uid)
+        uid = user.id
+        # SMTP session is blocking -> keep it off the event loop
+        return await run_in_threadpool(send_mail, email, uid)
     
     #if 200 <= status_code < 300:
         #return JSONResponse({"ok": True})
@@ -604,58 +766,117 @@ async def forgot_pass(
 
 
 @app.post("/reset-password")
-async def reet_pass(payload: dict = Body(...),db: Session = Depends(get_db)):
+async def reet_pass(request: Request, payload: dict = Body(...),db: Session = Depends(get_db)):
     password = payload["password"]
-    uid = decrypt_uid(payload["uid"])
-    user = get_user(db, uid)
-    user.password_hash = hash_password(password)
-    db.commit()
-
-@app.post("/search", response_model=list[UserBase])
-async def search_users(payload: Dict[str, Any], db: Session = Depends(get_db)):
-    user_id = payload.get("userId")
-    if not user_id:
-        raise HTTPException(status_code=400, detail="Missing userId")
+    # the per-account bucket is keyed on the uid, not the token: every reset
+    # link for one account shares it. Bad tokens still spend the per-IP bucket.
+    try:
+        uid = decrypt_uid(str(payload.get("uid") or ""))
+    except ValueError:
+        uid = None
+    async with RESET_PASSWORD_ADMISSION.admit(request, uid):
+        if uid is None:
+            raise HTTPException(status_code=400, detail="Invalid or expired token")
+        user = get_user(db, uid)
+        user.password_hash = await hash_password(password)
+        db.commit()
+        mark_recent_write(user.id)
 
-    me = db.query(User).filter(User.id == int(user_id)).first()
-    if not me:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    c_gender = payload.get("c_gender")
-    c_ff = payload.get("c_ff")
-    c_country = payload.get("c_country") 
-    c_smoking = payload.get("c_smoking")
-    c_tz = payload.get("c_tz")
-    c_pic = payload.get("c_pic")
-    c_ages1 = payload.get("c_ages1") 
-    c_ages2 =  payload.get("c_ages2")
-    c_name = payload.get("c_name")
-
-    q=search_user(db, c_gender, c_ff, c_country, c_smoking, c_tz, c_pic, c_ages1, c_ages2, c_name)
-    return apply_user_filters(q,me)    
+@app.post("/search", response_model=Union[list[UserBase], UserPage])
+async def search_users(
+    payload: Dict[str, Any],
+    session_uid: Optional[int] = Depends(session_user_id),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    me = await get_me(db, session_uid, payload)
+
+    # candidate ids come from the shared result cache (search_cache.py);
+    # self / blocks are per viewer, so they are dropped here, then one page is hydrated
+    key = search_cache_key(payload, me, ranked=not is_paged_request(payload))
+    rows = await search_candidate_rows(db, key)
+    hidden = await hidden_peer_ids(db, me.id)
+    return await candidate_list_response(db, rows, hidden, payload, with_facets=bool(payload.get("facets")))
        
 
+@app.get("/search/suggest")
+async def search_suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    userId: Optional[int] = Query(None, description="legacy clients without a session token"),
+    session_uid: Optional[int] = Depends(session_user_id),
+):
+    """
+    Name typeahead from the in-memory prefix index, minus self / blocked members
+    (in-memory per viewer, block_cache.py): no DB access on the common path.
+    """
+    hidden = await cached_hidden_peer_ids(acting_user_id(session_uid, userId))
+    return {"ok": True, "items": NAME_INDEX.suggest(q, limit, exclude=hidden)}
+
+
+def payload_id(payload: dict, key: str) -> int:
+    try:
+        return int(payload[key])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{key} must be an int")
+
+
 @app.post("/isLiked")
 async def is_liked(payload: dict = Body(...), db: Session = Depends(get_db)) :
-    user_id = payload.get("from_user_id")
-    peer_id = payload.get("to_user_id")
+    user_id = payload_id(payload, "from_user_id")
+    peer_id = payload_id(payload, "to_user_id")
     is_liked = is_user_liked(db, user_id, peer_id)
     return is_liked
 
 
 
-@app.patch("/block")
-def toggle_block(payload: dict = Body(...), db: Session = Depends(get_db)):
+MAX_RELATIONSHIP_PEERS = 500
+
+
+@app.post("/relationships")
+def relationships(payload: dict = Body(...), db: Session = Depends(get_db)):
+    """
+    Bulk like/block state for a page of profile cards.
+    Body: {"userId": 1, "peerIds": [2, 3, ...]}
+    Returns: {"ok": true, "states": {"2": {"liked", "likedMe", "blocked", "blockedMe"}, ...}}
+    """
     user_id = int(payload.get("userId", 0))
+    if user_id <= 0:
+        raise HTTPException(status_code=400, detail="Missing userId")
+
+    try:
+        peer_ids = list(dict.fromkeys(int(p) for p in (payload.get("peerIds") or [])))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="peerIds must be a list of ints")
+    if len(peer_ids) > MAX_RELATIONSHIP_PEERS:
+        raise HTTPException(status_code=400, detail=f"Max {MAX_RELATIONSHIP_PEERS} peerIds per request")
+
+    return {"ok": True, "states": get_relationship_states(db, user_id, peer_ids)}
+
+
+@app.patch("/block")
+def toggle_block(
+    payload: dict = Body(...),
+    session_uid: Optional[int] = Depends(session_user_id),
+    db: Session = Depends(get_db),
+):
+    user_id = acting_user_id(session_uid, payload.get("userId"))
     blocked_user_id = int(payload.get("blocked_userid", 0))
-    return block_user(db, user_id, blocked_user_id) 
+    res = block_user(db, user_id, blocked_user_id)
+    mark_recent_write(user_id)
+    return res
 
 
 @app.patch("/like")
-async def toggle_like(payload: dict = Body(...), db: Session = Depends(get_db)):
-    user_id = int(payload.get("userId", 0))
+async def toggle_like(
+    payload: dict = Body(...),
+    session_uid: Optional[int] = Depends(session_user_id),
+    db: Session = Depends(get_db),
+):
+    user_id = acting_user_id(session_uid, payload.get("userId"))
     liked_user_id = int(payload.get("liked_userid", 0))
-    return like_user(db, user_id, liked_user_id) 
+    res = like_user(db, user_id, liked_user_id)
+    mark_recent_write(user_id)
+    return res
 
 
 @app.post("/addMessage")
@@ -739,17 +960,17 @@ async def get_messages(
 
 @app.post("/is_blocked_by_peer")
 async def is_blocked(payload: dict = Body(...), db: Session = Depends(get_db)):
-    user_id = payload["userId"]
-    peer_id = payload["peerId"]
+    user_id = payload_id(payload, "userId")
+    peer_id = payload_id(payload, "peerId")
     is_blocked = is_user_blocked(db, user_id, peer_id)
     return is_blocked
 
 @app.get("/chat_rooms", response_model=List[ChatRoomOut2])
-async def list_chat_rooms(db: Session = Depends(get_db)):
+async def list_chat_rooms(db: Session = Depends(get_read_db)):
     return get_system_chat_rooms(db)
 
 @app.post("/user/{userid}", response_model=UserBase)
-async def get_user_by_id(userid: int, db: Session = Depends(get_db)):
+async def get_user_by_id(userid: int, db: Session = Depends(get_read_db)):
   return get_user(db,userid)
 
 @app.post("/freeze_user")
@@ -0,0 +1,182 @@
+# match_graph.py
+"""
+Background-maintained compatibility table for the /users feed.
+
+user_matches holds (viewer, candidate) when the candidate's filter
+preferences accept the viewer's attributes - exactly what
+helper.apply_user_filters checks at request time. /users then becomes an
+index lookup on user_matches instead of evaluating every member.
+
+Maintenance:
+- upsert_user marks the user dirty; the worker recomputes every pair that
+  user takes part in (as viewer and as candidate) every MATCH_FLUSH_SEC.
+- ages change on birthdays, so once a day the users born on that day are
+  marked dirty as well.
+Until a dirty user has been flushed, /users falls back to the live filters
+for that user (per process; other workers may be stale for one interval).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import and_, delete, func, lambda_stmt, literal, or_, select
+from sqlalchemy.dialects.postgresql import array, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from db import AsyncSessionLocal
+from models.user import User
+from models.user_match import UserMatch
+
+log = logging.getLogger("app")
+
+MATCH_FLUSH_SEC = 5
+
+_DIRTY: Set[int] = set()
+_FLUSHING: Set[int] = set()  # swapped out of _DIRTY, recompute not committed yet
+_LAST_BIRTHDAY_SWEEP: Optional[date] = None
+_WORKER: Optional[asyncio.Task] = None
+
+Viewer = aliased(User, name="viewer")
+Candidate = aliased(User, name="candidate")
+
+
+# -----------------------------
+# Pair predicate (SQL twin of apply_user_filters)
+# -----------------------------
+def pair_condition(v, c):
+    v_age = func.date_part("year", func.age(v.birth_date))
+    return and_(
+        c.id != v.id,
+        or_(
+            v.height.is_(None),
+            v.height <= 0,
+            c.filter_height_min.is_(None),
+            c.filter_height_max.is_(None),
+            and_(c.filter_height_min <= v.height, c.filter_height_max >= v.height),
+        ),
+        or_(
+            v.birth_date.is_(None),
+            c.filter_age_min.is_(None),
+            c.filter_age_max.is_(None),
+            and_(c.filter_age_min <= v_age, c.filter_age_max >= v_age),
+        ),
+        or_(
+            v.ff.is_(None),
+            c.filter_family_status.overlap(array([literal(0), v.ff])),
+        ),
+        or_(
+            v.smoking.is_(None),
+            c.filter_smoking_status == 0,
+            c.filter_smoking_status == v.smoking,
+        ),
+    )
+
+
+def select_matches_stmt(viewer_id: int):
+    # feed for viewer_id, as a lambda_stmt so /users can keep appending filters
+    return lambda_stmt(
+        lambda: select(User)
+        .join(UserMatch, UserMatch.candidate_id == User.id)
+        .where(UserMatch.viewer_id == viewer_id)
+    )
+
+
+def is_match_graph_fresh(user_id: int) -> bool:
+    return user_id not in _DIRTY and user_id not in _FLUSHING
+
+
+def mark_match_dirty(user_id: int) -> None:
+    _DIRTY.add(int(user_id))
+
+
+# -----------------------------
+# Recompute
+# -----------------------------
+async def recompute_matches(db: AsyncSession, user_ids: Iterable[int]) -> None:
+    """Rebuild every pair the given users take part in (caller commits)."""
+    ids = sorted(set(user_ids))
+    if not ids:
+        return
+
+    await db.execute(
+        delete(UserMatch).where(
+            or_(UserMatch.viewer_id.in_(ids), UserMatch.candidate_id.in_(ids))
+        )
+    )
+    # as viewer, then as candidate (ON CONFLICT covers pairs among the ids)
+    for side in (Viewer.id, Candidate.id):
+        pairs = (
+            select(Viewer.id, Candidate.id)
+            .select_from(Viewer)
+            .join(Candidate, pair_condition(Viewer, Candidate))
+            .where(side.in_(ids))
+        )
+        await db.execute(
+            pg_insert(UserMatch)
+            .from_select(["viewer_id", "candidate_id"], pairs)
+            .on_conflict_do_nothing()
+        )
+
+
+async def _birthday_ids(db: AsyncSession, today: date) -> List[int]:
+    days = [(today.month, today.day)]
+    # Feb 29 birthdays turn a year older on Mar 1 in non-leap years
+    if (today.month, today.day) == (3, 1) and (today - timedelta(days=1)).day == 28:
+        days.append((2, 29))
+    res = await db.execute(
+        select(User.id).where(
+            or_(*[and_(User.birth_month == m, User.birth_day == d) for m, d in days])
+        )
+    )
+    return list(res.scalars().all())
+
+
+async def flush_dirty() -> int:
+    global _DIRTY, _FLUSHING, _LAST_BIRTHDAY_SWEEP
+
+    today = date.today()
+    sweep = _LAST_BIRTHDAY_SWEEP != today
+    if not _DIRTY and not sweep:
+        return 0
+
+    # swap: an edit made while the recompute runs lands in the new _DIRTY
+    # and is picked up next round instead of being cleared with this batch
+    ids, _DIRTY = _DIRTY, set()
+    _FLUSHING = ids
+    try:
+        async with AsyncSessionLocal() as db:
+            if sweep:
+                ids.update(await _birthday_ids(db, today))
+            await recompute_matches(db, ids)
+            await db.commit()
+    except Exception:
+        # put them back, retry next round
+        _DIRTY.update(ids)
+        raise
+    finally:
+        _FLUSHING = set()
+
+    _LAST_BIRTHDAY_SWEEP = today
+    return len(ids)
+
+
+async def _worker() -> None:
+    while True:
+        await asyncio.sleep(MATCH_FLUSH_SEC)
+        try:
+            n = await flush_dirty()
+            if n:
+                log.info("Match graph: recomputed %d users", n)
+        except Exception:
+            # flush_dirty() put the ids back, try again next round
+            log.exception("Match graph flush failed")
+
+
+def start_match_graph_worker() -> None:
+    global _WORKER
+    if _WORKER is None or _WORKER.done():
+        _WORKER = asyncio.create_task(_worker())
@@ -0,0 +1,377 @@
+# member_columns.py
+"""
+Columnar in-process snapshot of the matching attributes of active members.
+
+Every attribute /users and /search filter on is a small integer, so each one
+is held as a NumPy array (one row per member). search_user() +
+apply_user_filters() then become vectorized boolean masks over the arrays,
+and Postgres is only hit to hydrate the final page.
+
+- rebuilt from Postgres at startup and every MEMBER_COLUMNS_REFRESH_SEC
+  (picks up writes made by other workers)
+- kept current for local writes by sync_user(), called next to
+  NAME_INDEX.sync_user() in upsert_user / freeze / delete / verify
+- name (trigram) and tz filters are not represented: supports() is False
+  and the caller falls back to SQL
+- until the first build succeeds, /users "best" is served unranked from
+  SQL; note_unranked_fallback() logs that and stats() counts it
+
+NULL integers are stored as NULL_INT. filter_family_status is stored as a
+bitmask of its values (status ids 0..62).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from db import AsyncSessionLocal
+from models.user import User
+from search_cache import CandidateRows, SearchKey, candidate_rows, epoch_us, years_before
+
+log = logging.getLogger("app")
+
+MEMBER_COLUMNS_REFRESH_SEC = 60
+FALLBACK_LOG_EVERY_SEC = 60
+
+# /users "best" ordering: score = sum(weight * component), each component in [0, 1]
+FEED_WEIGHTS = {
+    "fit": 3.0,       # share of my own filters they pass
+    "age": 1.0,       # 1 at same age, 0 at 10+ years apart
+    "height": 0.5,    # 1 at same height, 0 at 20+ cm apart
+    "recent": 1.0,    # last_seen_at, halves every 3 days
+    "online": 1.5,    # heartbeat within ws.notify.TTL_SEC
+    "liked_me": 2.0,
+}
+
+NULL_INT = np.iinfo(np.int32).min
+
+_INT_COLUMNS = (
+    "gender", "country", "ff", "smoking", "height",
+    "filter_height_min", "filter_height_max",
+    "filter_age_min", "filter_age_max",
+    "filter_smoking_status",
+)
+_SCORE_COLUMNS = ("id", "created_us", "last_seen_us", "birth_date", "height", "ff", "smoking")
+_LOAD_COLUMNS = (
+    User.id, User.created_at, User.last_seen_at, User.birth_date, User.image_path,
+    User.filter_family_status,
+    *(getattr(User, name) for name in _INT_COLUMNS),
+)
+
+
+def _int(v) -> int:
+    return NULL_INT if v is None else int(v)
+
+
+def _status_bits(values) -> int:
+    bits = 0
+    for v in values or ():
+        if 0 <= v < 63:
+            bits |= 1 << v
+    return bits
+
+
+def _row_values(user) -> Dict[str, Any]:
+    # user: a User or a Row of _LOAD_COLUMNS
+    values = {name: _int(getattr(user, name)) for name in _INT_COLUMNS}
+    values["id"] = user.id
+    values["created_us"] = epoch_us(user.created_at)
+    values["last_seen_us"] = epoch_us(user.last_seen_at)
+    values["birth_date"] = user.birth_date.toordinal() if user.birth_date else NULL_INT
+    values["has_image"] = bool(user.image_path)
+    values["ff_bits"] = _status_bits(user.filter_family_status)
+    return values
+
+
+def _in_range(value, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    # NULL bound = no filter
+    return (lo == NULL_INT) | (hi == NULL_INT) | ((lo <= value) & (hi >= value))
+
+
+def _is_active(user) -> bool:
+    return bool(user.is_email_verified) and not user.isdeleted and not user.isfreezed
+
+
+class MemberColumns:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.ready = False
+        self._size = 0
+        self._row: Dict[int, int] = {}
+        self._cols = self._empty(0)
+        self.built_at: Optional[datetime] = None
+        self.unranked_fallbacks = 0
+        self._fallback_logged_at: Optional[float] = None
+
+    @staticmethod
+    def _empty(capacity: int) -> Dict[str, np.ndarray]:
+        cols = {name: np.full(capacity, NULL_INT, np.int32) for name in _INT_COLUMNS}
+        cols["id"] = np.zeros(capacity, np.int64)
+        cols["created_us"] = np.zeros(capacity, np.int64)
+        cols["last_seen_us"] = np.zeros(capacity, np.int64)
+        cols["birth_date"] = np.full(capacity, NULL_INT, np.int32)
+        cols["has_image"] = np.zeros(capacity, bool)
+        cols["ff_bits"] = np.zeros(capacity, np.int64)
+        cols["alive"] = np.zeros(capacity, bool)
+        return cols
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def rebuild(self, users: Iterable) -> None:
+        rows = [_row_values(u) for u in users]
+        cols = self._empty(len(rows))
+        for name, arr in cols.items():
+            if name != "alive":
+                arr[:] = [r[name] for r in rows]
+        cols["alive"][:] = True
+        row = {r["id"]: i for i, r in enumerate(rows)}
+        # runs in a worker thread (load_member_columns): only the swap holds the lock
+        with self._lock:
+            self._cols = cols
+            self._size = len(rows)
+            self._row = row
+            self.ready = True
+            self.built_at = datetime.now(timezone.utc)
+
+    def _grow_locked(self) -> None:
+        old = self._cols
+        new = self._empty(max(1024, 2 * len(old["id"])))
+        for name, arr in old.items():
+            new[name][:self._size] = arr[:self._size]
+        self._cols = new
+
+    def upsert(self, user) -> None:
+        values = _row_values(user)
+        with self._lock:
+            i = self._row.get(user.id)
+            if i is None:
+                if self._size == len(self._cols["id"]):
+                    self._grow_locked()
+                i = self._size
+                self._size += 1
+                self._row[user.id] = i
+            for name, v in values.items():
+                self._cols[name][i] = v
+            self._cols["alive"][i] = True
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            i = self._row.pop(user_id, None)
+            if i is not None:
+                self._cols["alive"][i] = False  # slot is compacted by the next rebuild
+
+    def sync_user(self, user) -> None:
+        """Call after any write that can change a member's matching attributes or active state."""
+        if _is_active(user):
+            self.upsert(user)
+        else:
+            self.remove(user.id)
+
+    def serves_users_feed(self, best: bool, graph_fresh: bool) -> bool:
+        # "best" is only ranked here; "newest" prefers a fresh match graph
+        return self.ready and (best or not graph_fresh)
+
+    def note_unranked_fallback(self) -> None:
+        """/users asked for "best" while not ready: the caller serves it unranked."""
+        now = time.monotonic()
+        with self._lock:
+            self.unranked_fallbacks += 1
+            count = self.unranked_fallbacks
+            due = self._fallback_logged_at is None or now - self._fallback_logged_at >= FALLBACK_LOG_EVERY_SEC
+            if due:
+                self._fallback_logged_at = now
+        if due:
+            log.warning("Member columns not built yet: /users best served unranked (%d requests)", count)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "members": len(self._row),
+                "built_at": self.built_at.isoformat() if self.built_at else None,
+                "unranked_fallbacks": self.unranked_fallbacks,
+            }
+
+    @staticmethod
+    def supports(key: SearchKey) -> bool:
+        return not key.name_key and key.tz is None
+
+    def _mask(self, key: SearchKey, exclude: Iterable[int], only: Optional[Iterable[int]]):
+        # caller holds self._lock; returns (column views, row mask)
+        today = date.today()
+        n = self._size
+        c = {name: arr[:n] for name, arr in self._cols.items()}
+        m = c["alive"].copy()
+
+        # search filters
+        for name in ("gender", "ff", "country", "smoking"):
+            v = getattr(key, name)
+            if v is not None:
+                m &= c[name] == v
+        if key.pic:
+            m &= c["has_image"]
+        if key.min_age or key.max_age:
+            born = c["birth_date"]
+            m &= born != NULL_INT
+            if key.min_age:
+                m &= born <= years_before(today, key.min_age).toordinal()
+            if key.max_age:
+                m &= born > years_before(today, key.max_age + 1).toordinal()
+
+        # the candidates' own filters must accept the searcher
+        for value, lo_name, hi_name in (
+            (key.my_height, "filter_height_min", "filter_height_max"),
+            (key.my_age, "filter_age_min", "filter_age_max"),
+        ):
+            if value is not None:
+                m &= _in_range(value, c[lo_name], c[hi_name])
+        if key.my_ff is not None:
+            m &= (c["ff_bits"] & _status_bits([0, key.my_ff])) != 0
+        if key.my_smoking is not None:
+            fs = c["filter_smoking_status"]
+            m &= (fs == 0) | (fs == key.my_smoking)
+
+        exclude_ids = np.fromiter(exclude, np.int64)
+        if len(exclude_ids):
+            m &= ~np.isin(c["id"], exclude_ids)
+        if only is not None:
+            m &= np.isin(c["id"], np.fromiter(only, np.int64))
+        return c, m
+
+    def candidates(
+        self,
+        key: SearchKey,
+        exclude: Iterable[int] = (),
+        only: Optional[Iterable[int]] = None,
+    ) -> CandidateRows:
+        """
+        Same set as search_user() + active_members_only() + apply_member_filters()
+        for key (supports(key) must hold), minus exclude, restricted to only;
+        newest first (created_at, id).
+        """
+        with self._lock:
+            c, m = self._mask(key, exclude, only)
+            ids = c["id"][m]
+            created = c["created_us"][m]
+
+        order = np.lexsort((-ids, -created))  # created_at desc, then id desc
+        return candidate_rows(ids[order], created[order])
+
+    def ranked_candidates(
+        self,
+        key: SearchKey,
+        me,
+        exclude: Iterable[int] = (),
+        only: Optional[Iterable[int]] = None,
+        online: Iterable[int] = (),
+        liked_me: Iterable[int] = (),
+    ) -> CandidateRows:
+        """
+        candidates(), best match for me first (see FEED_WEIGHTS):
+        - fit: how many of MY filters (height, age, ff, smoking) they pass
+          (they already pass theirs against me - that is the mask)
+        - closeness in age and height
+        - last_seen_at recency, online now (ws.notify), liked me
+        Ties: newest first.
+        """
+        now_us = epoch_us(datetime.now(timezone.utc))
+        today = date.today().toordinal()
+
+        with self._lock:
+            c, m = self._mask(key, exclude, only)
+            c = {name: c[name][m] for name in _SCORE_COLUMNS}
+        ids = c["id"]
+
+        # float copies, NaN = NULL (keeps the int32 NULL_INT sentinel out of arithmetic)
+        def nullable(name: str) -> np.ndarray:
+            col = c[name].astype(np.float64)
+            col[c[name] == NULL_INT] = np.nan
+            return col
+
+        born = nullable("birth_date")
+        height = nullable("height")
+        age = np.floor((today - born) / 365.25)
+        ff = c["ff"]
+
+        # my own filters against them (NULL bound = no filter, like theirs against me)
+        fit = np.zeros(len(ids))
+        for lo, hi, theirs in (
+            (me.filter_height_min, me.filter_height_max, height),
+            (me.filter_age_min, me.filter_age_max, age),
+        ):
+            fit += 1 if lo is None or hi is None else (theirs >= lo) & (theirs <= hi)
+        my_ff_bits = _status_bits(me.filter_family_status)
+        if not my_ff_bits or my_ff_bits & 1:  # {0} = any family status
+            fit += 1
+        else:
+            known = (ff >= 0) & (ff < 63)
+            fit += known & ((np.left_shift(1, np.where(known, ff, 0).astype(np.int64)) & my_ff_bits) != 0)
+        my_smoking = me.filter_smoking_status or 0
+        fit += 1 if my_smoking == 0 else c["smoking"] == my_smoking
+
+        score = FEED_WEIGHTS["fit"] * fit / 4
+        if me.birth_date:
+            gap_years = np.abs(born - me.birth_date.toordinal()) / 365.25
+            score += FEED_WEIGHTS["age"] * np.nan_to_num(1 - np.minimum(gap_years / 10, 1))
+        if me.height:
+            gap_cm = np.abs(height - int(me.height))
+            score += FEED_WEIGHTS["height"] * np.nan_to_num(1 - np.minimum(gap_cm / 20, 1))
+        seen = c["last_seen_us"]
+        idle_days = np.maximum(now_us - seen, 0) / 86_400_000_000
+        score += FEED_WEIGHTS["recent"] * np.where(seen > 0, np.exp2(-idle_days / 3), 0)
+        score += FEED_WEIGHTS["online"] * np.isin(ids, np.fromiter(online, np.int64))
+        score += FEED_WEIGHTS["liked_me"] * np.isin(ids, np.fromiter(liked_me, np.int64))
+
+        order = np.lexsort((-ids, -c["created_us"], -score))  # score desc, then newest
+        return candidate_rows(ids[order], c["created_us"][order])
+
+
+MEMBER_COLUMNS = MemberColumns()
+
+
+async def load_member_columns(db: AsyncSession) -> int:
+    res = await db.execute(
+        select(*_LOAD_COLUMNS).where(
+            User.is_email_verified.is_(True),
+            User.isdeleted.is_not(True),
+            User.isfreezed.is_not(True),
+        )
+    )
+    # row -> array conversion is pure Python per member: keep it off the event loop
+    await run_in_threadpool(MEMBER_COLUMNS.rebuild, res.all())
+    return len(MEMBER_COLUMNS)
+
+
+async def _refresh_worker() -> None:
+    while True:
+        await asyncio.sleep(MEMBER_COLUMNS_REFRESH_SEC)
+        try:
+            async with AsyncSessionLocal() as db:
+                await load_member_columns(db)
+        except Exception:
+            log.exception("Member columns refresh failed")
+
+
+_WORKER: Optional[asyncio.Task] = None
+
+
+async def start_member_columns() -> None:
+    global _WORKER
+    try:
+        async with AsyncSessionLocal() as db:
+            n = await load_member_columns(db)
+        log.info("Member columns: %d active members", n)
+    except Exception:
+        log.exception("Member columns build failed")
+    if _WORKER is None or _WORKER.done():
+        _WORKER = asyncio.create_task(_refresh_worker())
@@ -0,0 +1,19 @@
+-- Canonical DM room key on chat_messages ('dm:<min id>:<max id>', as ws/chat.py _room_id()),
+-- so a conversation is one index range instead of an OR over both directions.
+-- Generated from from_user_id / to_user_id: adding the column fills the existing rows.
+
+BEGIN;
+
+ALTER TABLE public.chat_messages
+    ADD COLUMN room_key VARCHAR(64)
+    GENERATED ALWAYS AS (
+        'dm:' || least(from_user_id, to_user_id)::text || ':' || greatest(from_user_id, to_user_id)::text
+    ) STORED;
+
+-- /chat/history pages (before / after cursors) and the last-date seed
+CREATE INDEX ix_chat_messages_room_key_sent
+    ON public.chat_messages (room_key, sent_at DESC, id DESC);
+
+ANALYZE public.chat_messages;
+
+COMMIT;
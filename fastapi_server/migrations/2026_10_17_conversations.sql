@@ -0,0 +1,52 @@
+-- Denormalized inbox (see models/conversation.py): one row per (user, peer) DM thread
+-- with the last message, preview and unread / total counters.
+-- Kept up to date by ws/chat.py in the same transaction as each message write;
+-- this builds the rows for the existing messages.
+
+BEGIN;
+
+CREATE TABLE public.conversations (
+    user_id           INTEGER      NOT NULL,
+    peer_id           INTEGER      NOT NULL,
+    last_message_id   VARCHAR(36)  NOT NULL,
+    last_from_user_id INTEGER      NOT NULL,
+    last_at           TIMESTAMPTZ  NOT NULL,
+    preview           VARCHAR(120) NOT NULL DEFAULT '',
+    unread_count      INTEGER      NOT NULL DEFAULT 0,
+    total_count       INTEGER      NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, peer_id)
+);
+
+CREATE INDEX ix_conversations_user_last_at
+    ON public.conversations (user_id, last_at DESC, peer_id DESC);
+
+-- backfill: every message seen from both sides, last one per (user, peer)
+INSERT INTO public.conversations (
+    user_id, peer_id, last_message_id, last_from_user_id, last_at, preview,
+    unread_count, total_count
+)
+SELECT DISTINCT ON (s.user_id, s.peer_id)
+       s.user_id,
+       s.peer_id,
+       s.id,
+       s.from_user_id,
+       s.sent_at,
+       left(s.content, 120),
+       count(*) FILTER (WHERE s.to_user_id = s.user_id AND s.read_at IS NULL) OVER w,
+       count(*) OVER w
+FROM (
+    SELECT m.id, m.from_user_id, m.to_user_id, m.content, m.sent_at, m.read_at,
+           m.from_user_id AS user_id, m.to_user_id AS peer_id
+    FROM public.chat_messages m
+    UNION ALL
+    SELECT m.id, m.from_user_id, m.to_user_id, m.content, m.sent_at, m.read_at,
+           m.to_user_id, m.from_user_id
+    FROM public.chat_messages m
+    WHERE m.to_user_id <> m.from_user_id
+) s
+WINDOW w AS (PARTITION BY s.user_id, s.peer_id)
+ORDER BY s.user_id, s.peer_id, s.sent_at DESC, s.id DESC;
+
+ANALYZE public.conversations;
+
+COMMIT;
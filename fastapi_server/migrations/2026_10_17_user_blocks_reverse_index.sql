@@ -0,0 +1,9 @@
+-- Matching queries anti-join user_blocks in both directions:
+--   (user_id = me, blocked_user_id = candidate)  -> uq_user_block_pair
+--   (user_id = candidate, blocked_user_id = me)  -> this index
+
+BEGIN;
+
+CREATE INDEX ix_user_blocks_blocked_user_id_user_id ON user_blocks (blocked_user_id, user_id);
+
+COMMIT;
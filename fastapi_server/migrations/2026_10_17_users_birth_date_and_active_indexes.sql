@@ -0,0 +1,40 @@
+-- Stored, indexed birth date for exact/sargable age predicates,
+-- plus partial indexes over active members for the matching queries.
+-- birth_day/birth_month/birth_year stay the source of truth; birth_date is generated from them.
+
+BEGIN;
+
+-- make_date() raises on invalid input ("0" defaults, 31/02...), a generated column must not.
+CREATE OR REPLACE FUNCTION users_birth_date(y INTEGER, m INTEGER, d INTEGER)
+RETURNS DATE
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+BEGIN
+    IF y IS NULL OR m IS NULL OR d IS NULL OR y <= 0 OR m <= 0 OR d <= 0 THEN
+        RETURN NULL;
+    END IF;
+    RETURN make_date(y, m, d);
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+ALTER TABLE public.users
+    ADD COLUMN birth_date DATE
+    GENERATED ALWAYS AS (users_birth_date(birth_year, birth_month, birth_day)) STORED;
+
+CREATE INDEX ix_users_birth_date ON public.users (birth_date);
+
+CREATE INDEX ix_users_active_gender_birth_date ON public.users (gender, birth_date)
+    WHERE is_email_verified IS TRUE AND isdeleted IS NOT TRUE AND isfreezed IS NOT TRUE;
+
+CREATE INDEX ix_users_active_country_gender ON public.users (country, gender)
+    WHERE is_email_verified IS TRUE AND isdeleted IS NOT TRUE AND isfreezed IS NOT TRUE;
+
+CREATE INDEX ix_users_active_gender_height ON public.users (gender, height)
+    WHERE is_email_verified IS TRUE AND isdeleted IS NOT TRUE AND isfreezed IS NOT TRUE;
+
+ANALYZE public.users;
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Keyset paging for /users and /search: ORDER BY created_at DESC, id DESC
+-- with WHERE (created_at, id) < (:after_at, :after_id).
+
+BEGIN;
+
+CREATE INDEX ix_users_created_at_id ON public.users (created_at, id);
+
+COMMIT;
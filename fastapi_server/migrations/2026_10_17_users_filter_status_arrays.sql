@@ -0,0 +1,44 @@
+-- users.filter_family_status: CSV string ("1,2,3") -> INTEGER[] with a GIN index.
+-- users.filter_smoking_status: string -> INTEGER.
+-- "No filter" (NULL / '' / '0') becomes {0} resp. 0, so the matching predicate is
+-- a single indexable test: filter_family_status && {0, my_ff}, filter_smoking_status IN (0, my_smoking).
+
+BEGIN;
+
+ALTER TABLE public.users
+    ALTER COLUMN filter_family_status TYPE INTEGER[]
+    USING CASE
+        WHEN filter_family_status ~ '^[0-9,[:space:]]*$' THEN
+            COALESCE(
+                NULLIF(
+                    array_remove(
+                        array_remove(
+                            string_to_array(regexp_replace(filter_family_status, '[[:space:]]', '', 'g'), ',', '')::INTEGER[],
+                            NULL
+                        ),
+                        0
+                    ),
+                    '{}'
+                ),
+                '{0}'
+            )
+        ELSE '{0}'
+    END,
+    ALTER COLUMN filter_family_status SET DEFAULT '{0}',
+    ALTER COLUMN filter_family_status SET NOT NULL;
+
+ALTER TABLE public.users
+    ALTER COLUMN filter_smoking_status TYPE INTEGER
+    USING CASE
+        WHEN filter_smoking_status ~ '^[[:space:]]*[0-9]+[[:space:]]*$' THEN trim(filter_smoking_status)::INTEGER
+        ELSE 0
+    END,
+    ALTER COLUMN filter_smoking_status SET DEFAULT 0,
+    ALTER COLUMN filter_smoking_status SET NOT NULL;
+
+CREATE INDEX ix_users_filter_family_status ON public.users USING gin (filter_family_status);
+CREATE INDEX ix_users_filter_smoking_status ON public.users (filter_smoking_status);
+
+ANALYZE public.users;
+
+COMMIT;
@@ -0,0 +1,35 @@
+-- Normalized, trigram-indexed name search (see name_search.py for the Python twin).
+-- users.name_search = name without niqqud, final letters folded, lowercased.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION users_name_search_key(s TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$
+    SELECT btrim(regexp_replace(
+        lower(translate(
+            regexp_replace(coalesce(s, ''), '[֑-ׇֽֿׁׂׅׄ]', '', 'g'),
+            'ךםןףץ',
+            'כמנפצ'
+        )),
+        '\s+', ' ', 'g'
+    ))
+$$;
+
+ALTER TABLE public.users
+    ADD COLUMN name_search TEXT
+    GENERATED ALWAYS AS (users_name_search_key(name)) STORED;
+
+CREATE INDEX ix_users_name_search_trgm ON public.users USING gin (name_search gin_trgm_ops);
+
+-- admin search also matches e-mail by substring
+CREATE INDEX ix_users_email_lower_trgm ON public.users USING gin (lower(email) gin_trgm_ops);
+
+ANALYZE public.users;
+
+COMMIT;
@@ -0,0 +1,35 @@
+-- Precomputed /users feed (see match_graph.py).
+-- (viewer_id, candidate_id) = the candidate's filter preferences accept the viewer.
+-- Kept up to date by the app (upsert_user + daily birthday sweep); this builds the initial set.
+--
+-- Must run after 2026_10_17_users_birth_date_and_active_indexes.sql (users.birth_date) and
+-- 2026_10_17_users_filter_status_arrays.sql (int[] filter_family_status): the "zz_" prefix
+-- keeps it last in name order.
+
+BEGIN;
+
+CREATE TABLE public.user_matches (
+    viewer_id    INTEGER NOT NULL,
+    candidate_id INTEGER NOT NULL,
+    PRIMARY KEY (viewer_id, candidate_id)
+);
+
+CREATE INDEX ix_user_matches_candidate_id ON public.user_matches (candidate_id);
+
+INSERT INTO public.user_matches (viewer_id, candidate_id)
+SELECT v.id, c.id
+FROM public.users v
+JOIN public.users c ON c.id <> v.id
+WHERE (v.height IS NULL OR v.height <= 0
+       OR c.filter_height_min IS NULL OR c.filter_height_max IS NULL
+       OR (c.filter_height_min <= v.height AND c.filter_height_max >= v.height))
+  AND (v.birth_date IS NULL
+       OR c.filter_age_min IS NULL OR c.filter_age_max IS NULL
+       OR (c.filter_age_min <= date_part('year', age(v.birth_date))
+           AND c.filter_age_max >= date_part('year', age(v.birth_date))))
+  AND (v.ff IS NULL OR c.filter_family_status && ARRAY[0, v.ff])
+  AND (v.smoking IS NULL OR c.filter_smoking_status = 0 OR c.filter_smoking_status = v.smoking);
+
+ANALYZE public.user_matches;
+
+COMMIT;
@@ -2,12 +2,14 @@
 
 from sqlalchemy import (
     Column,
+    Computed,
     Integer,
     String,
     Text,
     DateTime,
     ForeignKey,
     Index,
+    text,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -36,6 +38,15 @@ class ChatMessage(Base):
     read_at = Column(DateTime(timezone=True), nullable=True)
     edited_at = Column(DateTime(timezone=True), nullable=True)
 
+    # canonical DM room, same format as ws.chat._room_id()
+    room_key = Column(
+        String(64),
+        Computed(
+            "'dm:' || least(from_user_id, to_user_id)::text || ':' || greatest(from_user_id, to_user_id)::text",
+            persisted=True,
+        ),
+    )
+
 
     __table_args__ = (
         Index(
@@ -44,4 +55,5 @@ class ChatMessage(Base):
             "to_user_id",
             "sent_at",
         ),
+        Index("ix_chat_messages_room_key_sent", "room_key", text("sent_at DESC"), text("id DESC")),
     )
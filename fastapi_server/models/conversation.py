@@ -0,0 +1,31 @@
+# models/conversation.py
+from sqlalchemy import Column, DateTime, Index, Integer, String, text
+from sqlalchemy.orm import DeclarativeBase
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Conversation(Base):
+    """
+    Denormalized inbox: one row per (user, peer) DM thread, kept current by
+    ws/chat.py in the same transaction as the chat_messages write.
+    """
+    __tablename__ = "conversations"
+    __table_args__ = (
+        # /chat/threads: newest first, keyset on (last_at, peer_id)
+        Index("ix_conversations_user_last_at", "user_id", text("last_at DESC"), text("peer_id DESC")),
+        {"schema": "public"},
+    )
+
+    user_id = Column(Integer, primary_key=True)
+    peer_id = Column(Integer, primary_key=True)
+
+    last_message_id = Column(String(36), nullable=False)
+    last_from_user_id = Column(Integer, nullable=False)
+    last_at = Column(DateTime(timezone=True), nullable=False)
+    preview = Column(String(120), nullable=False, server_default="")
+
+    unread_count = Column(Integer, nullable=False, server_default="0")  # peer -> user, not read yet
+    total_count = Column(Integer, nullable=False, server_default="0")
@@ -2,33 +2,64 @@
 from sqlalchemy import (
     BigInteger,
     Column,
+    Computed,
+    Date,
     DateTime,
+    Index,
     Integer,
     String,
     Text,
     func,
+    text,
     Boolean
 )
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 
 
 class Base(DeclarativeBase):
     pass
 
 
+# "active member" predicate shared by the partial indexes below (and the matching queries)
+ACTIVE_MEMBER_SQL = "is_email_verified IS TRUE AND isdeleted IS NOT TRUE AND isfreezed IS NOT TRUE"
+
+
 class User(Base):
     __tablename__ = "users"
-    __table_args__ = {"schema": "public"}  # important if you're using schemas
+    __table_args__ = (
+        Index("ix_users_birth_date", "birth_date"),
+        Index("ix_users_active_gender_birth_date", "gender", "birth_date",
+              postgresql_where=text(ACTIVE_MEMBER_SQL)),
+        Index("ix_users_active_country_gender", "country", "gender",
+              postgresql_where=text(ACTIVE_MEMBER_SQL)),
+        Index("ix_users_active_gender_height", "gender", "height",
+              postgresql_where=text(ACTIVE_MEMBER_SQL)),
+        Index("ix_users_created_at_id", "created_at", "id"),  # /users, /search keyset paging
+        Index("ix_users_name_search_trgm", "name_search",
+              postgresql_using="gin", postgresql_ops={"name_search": "gin_trgm_ops"}),
+        Index("ix_users_email_lower_trgm", text("lower(email) gin_trgm_ops"),
+              postgresql_using="gin"),
+        Index("ix_users_filter_family_status", "filter_family_status", postgresql_using="gin"),
+        Index("ix_users_filter_smoking_status", "filter_smoking_status"),
+        {"schema": "public"},  # important if you're using schemas
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
     name = Column(String(255))
+    # generated: normalized name for trigram search (name_search.py has the Python twin)
+    name_search = Column(Text, Computed("users_name_search_key(name)", persisted=True))
     gender = Column(Integer)
 
     birth_day = Column(Integer)
     birth_month = Column(Integer)
     birth_year = Column(Integer)
+    # generated by postgres from the 3 ints above (NULL when they are not a real date)
+    birth_date = Column(
+        Date,
+        Computed("users_birth_date(birth_year, birth_month, birth_day)", persisted=True),
+    )
 
     country = Column(Integer)
     phone = Column(String(50))
@@ -63,8 +94,10 @@ class User(Base):
     filter_age_min = Column(Integer)
     filter_age_max = Column(Integer)
 
-    filter_family_status = Column(String(100))
-    filter_smoking_status = Column(String(20))
+    # accepted statuses; {0} = no filter (so "no filter OR mine" is one GIN overlap: && {0, mine})
+    filter_family_status = Column(ARRAY(Integer), nullable=False, server_default="{0}")
+    # 0 = no filter
+    filter_smoking_status = Column(Integer, nullable=False, server_default="0")
 
     notify_push = Column(Boolean, nullable=False, server_default="false")
     notify_email = Column(Boolean, nullable=False, server_default="false")
@@ -86,4 +119,8 @@ class User(Base):
         DateTime(timezone=True),
         nullable=True
     )
+
+    @property
+    def has_image(self) -> bool:
+        return bool(self.image_path)
     
\ No newline at end of file
@@ -14,6 +14,8 @@ class UserBlock(Base):
         UniqueConstraint("user_id", "blocked_user_id", name="uq_user_block_pair"),
         Index("ix_user_blocks_user_id", "user_id"),
         Index("ix_user_blocks_blocked_user_id", "blocked_user_id"),
+        # "who blocked me" anti-join in the matching queries
+        Index("ix_user_blocks_blocked_user_id_user_id", "blocked_user_id", "user_id"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -0,0 +1,23 @@
+# models/user_match.py
+from sqlalchemy import Column, Index, Integer
+from sqlalchemy.orm import DeclarativeBase
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class UserMatch(Base):
+    """
+    Precomputed /users feed: one row per (viewer, candidate) where the
+    candidate's filter preferences accept the viewer (see match_graph.py).
+    """
+    __tablename__ = "user_matches"
+    __table_args__ = (
+        Index("ix_user_matches_candidate_id", "candidate_id"),
+        {"schema": "public"},
+    )
+
+    # PK (viewer_id, candidate_id) is the feed lookup index
+    viewer_id = Column(Integer, primary_key=True)
+    candidate_id = Column(Integer, primary_key=True)
@@ -0,0 +1,182 @@
+# name_search.py
+"""
+Normalized name search key.
+
+The same folding runs in Postgres as users_name_search_key() (generated
+column users.name_search, pg_trgm GIN index) and here for the query text,
+so both sides always compare the same form:
+- Hebrew niqqud / cantillation marks removed
+- final letters folded (ך ם ן ף ץ -> כ מ נ פ צ)
+- lowercased (Latin), whitespace collapsed
+
+NAME_INDEX is a process-local prefix index over the same keys for the
+/search/suggest typeahead (no Postgres round trip per keystroke).
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import re
+import threading
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import AsyncSessionLocal
+from models.user import User
+
+log = logging.getLogger("app")
+
+# Hebrew points and cantillation marks only (keeps maqaf, sof pasuq, letters)
+_NIQQUD_RE = re.compile("[֑-ׇֽֿׁׂׅׄ]")
+_SPACES_RE = re.compile(r"\s+")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+
+def escape_like(s: str) -> str:
+    # literal substring inside LIKE '%...%' ... ESCAPE '/'
+    return s.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def name_search_key(name: str | None) -> str:
+    if not name:
+        return ""
+    s = _NIQQUD_RE.sub("", name)
+    s = s.translate(_FINAL_LETTERS).lower()
+    return _SPACES_RE.sub(" ", s).strip()
+
+
+# -----------------------------
+# In-memory prefix index (typeahead)
+# -----------------------------
+NAME_INDEX_REFRESH_SEC = 300  # full rebuild, picks up writes made by other workers
+
+
+def _is_active(user) -> bool:
+    return bool(user.is_email_verified) and not user.isdeleted and not user.isfreezed
+
+
+def _word_keys(key: str) -> List[str]:
+    # "דני כהן" -> ["דני כהן", "כהן"] so a prefix of any word matches
+    words = key.split(" ")
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class NamePrefixIndex:
+    """
+    Sorted (key, userId) entries over active members' normalized names;
+    a prefix lookup is two bisects plus a short scan.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: List[Tuple[str, int]] = []
+        self._names: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def rebuild(self, rows: Iterable[Tuple[int, Optional[str]]]) -> None:
+        entries: List[Tuple[str, int]] = []
+        names: Dict[int, str] = {}
+        for user_id, name in rows:
+            key = name_search_key(name)
+            if not key:
+                continue
+            names[user_id] = name
+            entries.extend((k, user_id) for k in _word_keys(key))
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._names = names
+
+    def _remove_locked(self, user_id: int) -> None:
+        old = self._names.pop(user_id, None)
+        if old is None:
+            return
+        for k in _word_keys(name_search_key(old)):
+            i = bisect.bisect_left(self._entries, (k, user_id))
+            if i < len(self._entries) and self._entries[i] == (k, user_id):
+                del self._entries[i]
+
+    def upsert(self, user_id: int, name: Optional[str]) -> None:
+        key = name_search_key(name)
+        with self._lock:
+            self._remove_locked(user_id)
+            if not key:
+                return
+            self._names[user_id] = name
+            for k in _word_keys(key):
+                bisect.insort(self._entries, (k, user_id))
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def sync_user(self, user) -> None:
+        """Call after any write that can change a member's name or active state."""
+        if _is_active(user):
+            self.upsert(user.id, user.name)
+        else:
+            self.remove(user.id)
+
+    def suggest(self, prefix: str, limit: int = 10, exclude: AbstractSet[int] = frozenset()) -> List[dict]:
+        # exclude is skipped before counting towards limit (self / blocked members)
+        key = name_search_key(prefix)
+        if not key:
+            return []
+        out: List[dict] = []
+        seen = set(exclude)
+        with self._lock:
+            i = bisect.bisect_left(self._entries, (key, -1))
+            while i < len(self._entries) and len(out) < limit:
+                k, user_id = self._entries[i]
+                if not k.startswith(key):
+                    break
+                if user_id not in seen:
+                    seen.add(user_id)
+                    out.append({"userId": user_id, "name": self._names[user_id]})
+                i += 1
+        return out
+
+
+NAME_INDEX = NamePrefixIndex()
+
+
+async def load_name_index(db: AsyncSession) -> int:
+    res = await db.execute(
+        select(User.id, User.name).where(
+            User.is_email_verified.is_(True),
+            User.isdeleted.is_not(True),
+            User.isfreezed.is_not(True),
+        )
+    )
+    NAME_INDEX.rebuild(res.all())
+    return len(NAME_INDEX)
+
+
+async def _refresh_worker() -> None:
+    while True:
+        await asyncio.sleep(NAME_INDEX_REFRESH_SEC)
+        try:
+            async with AsyncSessionLocal() as db:
+                await load_name_index(db)
+        except Exception:
+            log.exception("Name index refresh failed")
+
+
+_WORKER: Optional[asyncio.Task] = None
+
+
+async def start_name_index() -> None:
+    global _WORKER
+    try:
+        async with AsyncSessionLocal() as db:
+            n = await load_name_index(db)
+        log.info("Name index: %d active members", n)
+    except Exception:
+        log.exception("Name index build failed")
+    if _WORKER is None or _WORKER.done():
+        _WORKER = asyncio.create_task(_refresh_worker())
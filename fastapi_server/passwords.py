@@ -0,0 +1,104 @@
+# passwords.py
+"""
+Password hashing off the event loop.
+
+pbkdf2 is deliberately slow CPU work; run inline in an async handler it
+stalls every websocket on the worker. Hashes and verifies run in a bounded
+thread pool instead (hashlib releases the GIL inside pbkdf2, so the
+threads really run in parallel):
+- at most PASSWORD_POOL_WORKERS hashes run at once
+- at most PASSWORD_POOL_MAX_QUEUE wait; beyond that -> 503 + Retry-After
+- PASSWORD_POOL.stats() exposes queue depth / wait time
+
+Rehash on login: raising PASSWORD_HASH_ROUNDS makes older hashes "need
+update"; verify_password_and_update() then returns a fresh hash for the
+caller to store, so the cost goes up one login at a time.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))  # passlib's pbkdf2_sha256 default
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", "64"))
+
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,  # fewer rounds -> needs_update
+)
+
+
+class PasswordPool:
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+        self._lock = threading.Lock()
+        self.queued = 0      # submitted, waiting for a thread
+        self.running = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_sec_total = 0.0
+
+    def _job(self, fn: Callable[..., Any], args: tuple, submitted_at: float) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._wait_sec_total += time.monotonic() - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server busy, please retry",
+                    headers={"Retry-After": "1"},
+                )
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._job, fn, args, time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(1000 * self._wait_sec_total / self.completed, 2) if self.completed else None,
+                "hash_rounds": PASSWORD_HASH_ROUNDS,
+            }
+
+
+PASSWORD_POOL = PasswordPool(PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE)
+
+
+async def hash_password(raw: str) -> str:
+    return await PASSWORD_POOL.run(pwd_context.hash, raw)
+
+
+async def verify_password_and_update(raw: str, password_hash: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """(matches, new_hash) - new_hash is set when the stored hash should be replaced."""
+    return await PASSWORD_POOL.run(pwd_context.verify_and_update, raw, password_hash)
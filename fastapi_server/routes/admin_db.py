@@ -0,0 +1,55 @@
+# routes/admin_db.py
+from fastapi import APIRouter
+
+from admission import admission_stats
+from db import pool_status
+from member_columns import MEMBER_COLUMNS
+from passwords import PASSWORD_POOL
+from search_cache import SEARCH_CACHE
+
+admin_db_router = APIRouter(prefix="/api/admin/db", tags=["admin-db"])
+
+
+@admin_db_router.get("/pool")
+def admin_pool_status():
+    """
+    Connection pool state for this worker (sync + async engines):
+    checked-out / idle connections, overflow and checkout wait histogram.
+    """
+    return pool_status()
+
+
+@admin_db_router.get("/search-cache")
+def admin_search_cache_stats():
+    """
+    Shared /search result cache for this worker:
+    entries and bytes held, hit rate, LRU evictions, TTL expiries and write invalidations.
+    """
+    return SEARCH_CACHE.stats()
+
+
+@admin_db_router.get("/password-pool")
+def admin_password_pool_stats():
+    """
+    Password hashing pool for this worker (passwords.py):
+    running / queued hashes, peak queue depth, average wait, 503 rejections.
+    """
+    return PASSWORD_POOL.stats()
+
+
+@admin_db_router.get("/admission")
+def admin_admission_stats():
+    """
+    Auth admission control for this worker (admission.py):
+    concurrency budget in use / rejected, admitted vs 429 per route.
+    """
+    return admission_stats()
+
+
+@admin_db_router.get("/member-columns")
+def admin_member_columns_stats():
+    """
+    In-process member snapshot for this worker (member_columns.py):
+    built or not, active members, last build, /users "best" served unranked.
+    """
+    return MEMBER_COLUMNS.stats()
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from db import get_db
+from db import get_db, get_read_db
 from models.site_page import SitePage
 
 # -----------------------------
@@ -12,7 +12,7 @@ public_pages_router = APIRouter(prefix="/api/pages", tags=["pages"])
 @public_pages_router.get("/content")
 def get_page_content(
     path: str = Query(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     row = db.query(SitePage).filter(
         SitePage.path == path,
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_, func, desc, asc
 from db import get_db
 from models.user import User
+from name_search import escape_like, name_search_key
 
 admin_users_router = APIRouter(prefix="/api/admin/users", tags=["admin-users"])
 
@@ -20,13 +21,14 @@ def admin_list_users(
 ):
     query = db.query(User)
 
-    # search
+    # search (both sides served by trigram GIN indexes)
     if q:
-        qq = f"%{q.strip().lower()}%"
+        name_qq = f"%{escape_like(name_search_key(q))}%"
+        email_qq = f"%{escape_like(q.strip().lower())}%"
         query = query.filter(
             or_(
-                func.lower(User.name).like(qq),
-                func.lower(User.email).like(qq),
+                User.name_search.like(name_qq, escape="/"),
+                func.lower(User.email).like(email_qq, escape="/"),
             )
         )
 
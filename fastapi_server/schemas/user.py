@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -48,8 +48,8 @@ class UserBase(BaseModel):
     filter_age_min: Optional[int] = None
     filter_age_max: Optional[int] = None
 
-    filter_family_status: Optional[str] = None
-    filter_smoking_status: Optional[str] = None
+    filter_family_status: Optional[List[int]] = None   # [0] = no filter
+    filter_smoking_status: Optional[int] = None        # 0 = no filter
 
     notify_push: Optional[bool] = False
     notify_email: Optional[bool] = False
@@ -67,4 +67,36 @@ class UserBase(BaseModel):
 
     isfreezed: Optional[bool] = False  
     isdeleted: Optional[bool] = False
-    is_email_verified: Optional[bool] = False
\ No newline at end of file
+    is_email_verified: Optional[bool] = False
+
+
+class UserCard(BaseModel):
+    """Compact listing row for /users and /search with view=card."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: Optional[str] = None
+    gender: Optional[int] = None
+    birth_day: Optional[int] = None
+    birth_month: Optional[int] = None
+    birth_year: Optional[int] = None
+    country: Optional[int] = None
+    has_image: bool = False
+    last_seen_at: Optional[datetime] = None
+
+
+class FacetCount(BaseModel):
+    value: Any   # int bucket (country / ff / smoking / gender), bool for has_picture, None = unset
+    count: int
+
+
+class UserCardPage(BaseModel):
+    items: List[UserCard]
+    next_cursor: Optional[str] = None
+    facets: Optional[Dict[str, List[FacetCount]]] = None
+
+
+class UserPage(BaseModel):
+    items: List[UserBase]
+    next_cursor: Optional[str] = None   # pass back as "cursor"; None = last page
+    facets: Optional[Dict[str, List[FacetCount]]] = None   # /search with "facets": true
@@ -0,0 +1,229 @@
+# search_cache.py
+"""
+Shared /search result cache.
+
+The heavy part of /search (search filters + active-member predicate + the
+candidates' own height/age/family/smoking preferences checked against the
+searcher) depends only on the search filters and four searcher attributes.
+Its result, the ordered candidate ids, is cached under that normalized tuple
+(SearchKey) and shared by every member who sends the same combination.
+Per-viewer parts (self, blocks) are applied on the cached ids and the page
+is hydrated by primary key.
+
+- entries expire after SEARCH_CACHE_TTL_SEC (bounds staleness from writes
+  made by other workers)
+- least recently used entries are evicted past SEARCH_CACHE_MAX_ENTRIES or
+  SEARCH_CACHE_MAX_BYTES of candidate arrays (12 bytes per candidate); a
+  single result larger than the byte budget is not cached
+- a local write to a member drops every entry that member could appear in,
+  before or after the change (invalidate_member)
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+SEARCH_CACHE_TTL_SEC = int(os.getenv("SEARCH_CACHE_TTL_SEC", "60"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+
+def epoch_us(ts: Optional[datetime]) -> int:
+    if ts is None:
+        return 0
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // _US
+
+
+def from_epoch_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(us))
+
+
+class CandidateRows(NamedTuple):
+    """
+    Candidates in result order as two parallel read-only arrays (shared
+    between requests): user id and created_at in epoch microseconds.
+    Python objects are only built for the page that is served.
+    """
+    ids: np.ndarray         # int32
+    created_us: np.ndarray  # int64
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.created_us.nbytes
+
+
+def candidate_rows(ids, created_us) -> CandidateRows:
+    ids = np.array(ids, dtype=np.int32)
+    created_us = np.array(created_us, dtype=np.int64)
+    ids.setflags(write=False)
+    created_us.setflags(write=False)
+    return CandidateRows(ids, created_us)
+
+
+def candidate_rows_from(rows: Iterable[Tuple[int, Optional[datetime]]]) -> CandidateRows:
+    # (id, created_at) rows from SQL
+    rows = list(rows)
+    return candidate_rows(
+        np.fromiter((r[0] for r in rows), np.int32, len(rows)),
+        np.fromiter((epoch_us(r[1]) for r in rows), np.int64, len(rows)),
+    )
+
+
+class SearchKey(NamedTuple):
+    # search filters (None / 0 / "" = not filtered)
+    gender: Optional[int]
+    ff: Optional[int]
+    country: Optional[int]
+    smoking: Optional[int]
+    tz: Optional[int]
+    pic: bool
+    min_age: int
+    max_age: int
+    name_key: str
+    # searcher attributes the candidates' own filters are checked against
+    my_height: Optional[int]
+    my_age: Optional[int]
+    my_ff: Optional[int]
+    my_smoking: Optional[int]
+    # True: best name match first, else newest first (created_at, id)
+    ranked: bool
+
+
+def member_snapshot(user) -> Optional[Dict[str, Any]]:
+    """The searchable attributes of a member; None if not an active member."""
+    if not (user.is_email_verified and not user.isdeleted and not user.isfreezed):
+        return None
+    return {
+        "gender": user.gender,
+        "ff": user.ff,
+        "country": user.country,
+        "smoking": user.smoking,
+        "has_image": bool(user.image_path),
+        "birth_date": user.birth_date,
+    }
+
+
+def years_before(today: date, years: int) -> date:
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:  # Feb 29 -> Feb 28 in a non-leap year
+        return today.replace(year=today.year - years, day=28)
+
+
+def _could_appear(key: SearchKey, m: Dict[str, Any]) -> bool:
+    # conservative: tz, name and the member's own filters are not checked
+    if key.gender is not None and m["gender"] != key.gender:
+        return False
+    if key.ff is not None and m["ff"] != key.ff:
+        return False
+    if key.country is not None and m["country"] != key.country:
+        return False
+    if key.smoking is not None and m["smoking"] != key.smoking:
+        return False
+    if key.pic and not m["has_image"]:
+        return False
+    if key.min_age or key.max_age:
+        born = m["birth_date"]
+        if born is None:
+            return False
+        today = date.today()
+        if key.min_age and born > years_before(today, key.min_age):
+            return False
+        if key.max_age and born <= years_before(today, key.max_age + 1):
+            return False
+    return True
+
+
+class SearchResultCache:
+    """TTL + LRU map SearchKey -> CandidateRows, bounded by entries and bytes."""
+
+    def __init__(self, max_entries: int, ttl_sec: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[SearchKey, Tuple[float, CandidateRows]]" = OrderedDict()
+        self.nbytes = 0
+        # bumped by every invalidation; a result computed across one is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    def get(self, key: SearchKey) -> Optional[CandidateRows]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._drop_locked(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _drop_locked(self, key: SearchKey) -> None:
+        _, rows = self._entries.pop(key)
+        self.nbytes -= rows.nbytes
+
+    def put(self, key: SearchKey, rows: CandidateRows, generation: int) -> None:
+        if self.max_entries <= 0 or self.ttl_sec <= 0 or rows.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop_locked(key)
+            self._entries[key] = (time.monotonic() + self.ttl_sec, rows)
+            self.nbytes += rows.nbytes
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self._drop_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_member(self, *snapshots: Optional[Dict[str, Any]]) -> None:
+        """Pass member_snapshot() taken before and after a write to that member."""
+        snaps = [s for s in snapshots if s]
+        if not snaps:
+            return
+        with self._lock:
+            self.generation += 1
+            stale = [k for k in self._entries if any(_could_appear(k, s) for s in snaps)]
+            for k in stale:
+                self._drop_locked(k)
+            self.invalidated += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+            }
+
+
+SEARCH_CACHE = SearchResultCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SEC, SEARCH_CACHE_MAX_BYTES)
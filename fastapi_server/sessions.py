@@ -0,0 +1,220 @@
+# sessions.py
+"""
+Signed session tokens + in-process principal cache.
+
+/login issues a compact HMAC-SHA256 token ("<payload>.<signature>",
+base64url; payload = {"uid", "iat", "exp"}), returned in the
+X-Session-Token header and as an HttpOnly cookie. session_user_id() (a
+FastAPI dependency) verifies it without touching the DB; helper.get_me()
+then resolves the member from PRINCIPALS, a small TTL cache that the
+write helpers (upsert_user, freeze, delete, verify) invalidate.
+
+Requests without a valid token keep working on the body "userId" (older
+clients); a token that no longer verifies (expired, or signed under another
+secret after a restart) counts as absent and its cookie is cleared.
+With a valid token, a body userId that names someone else is rejected.
+
+The same secret signs the short-lived read pin cookie (see db.py): a
+"this browser just wrote, read from the primary until <t>" marker that
+any worker can verify.
+
+SESSION_SECRET must be the same on every worker; without it a random
+per-process secret is used (tokens then die with the process).
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import inspect
+
+from models.user import User
+
+log = logging.getLogger("app")
+
+SESSION_TTL_SEC = int(os.getenv("SESSION_TTL_SEC", str(30 * 24 * 3600)))
+SESSION_COOKIE = "session"
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "0").lower() in ("1", "true", "yes")
+READ_PIN_COOKIE = "read_pin"
+PRINCIPAL_TTL_SEC = 60
+PRINCIPAL_MAX_ENTRIES = 10_000
+
+_SECRET = os.getenv("SESSION_SECRET", "").encode()
+if not _SECRET:
+    log.warning("SESSION_SECRET is not set: session tokens are valid in this process only")
+    _SECRET = secrets.token_bytes(32)
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64(hmac.new(_SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_session_token(user_id: int) -> str:
+    now = int(time.time())
+    payload = _b64(json.dumps({"uid": user_id, "iat": now, "exp": now + SESSION_TTL_SEC},
+                              separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token: str) -> Optional[int]:
+    """User id of a valid, unexpired token, else None."""
+    payload, _, sig = token.partition(".")
+    if not sig or not hmac.compare_digest(sig, _sign(payload)):
+        return None
+    try:
+        claims = json.loads(_unb64(payload))
+        if int(claims["exp"]) < time.time():
+            return None
+        return int(claims["uid"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def set_session_cookie(response: Response, token: str) -> None:
+    response.headers["X-Session-Token"] = token
+    response.set_cookie(
+        SESSION_COOKIE, token,
+        max_age=SESSION_TTL_SEC, httponly=True, samesite="lax", secure=SESSION_COOKIE_SECURE,
+    )
+
+
+def clear_session_cookie(response: Response) -> None:
+    response.delete_cookie(
+        SESSION_COOKIE, httponly=True, samesite="lax", secure=SESSION_COOKIE_SECURE,
+    )
+
+
+def _request_token(request: Request) -> Optional[str]:
+    # "Authorization: Bearer <token>", else the session cookie
+    auth = request.headers.get("authorization", "")
+    if auth[:7].lower() == "bearer ":
+        return auth[7:].strip() or None
+    return request.cookies.get(SESSION_COOKIE)
+
+
+def peek_session_user_id(request: Request) -> Optional[int]:
+    # best effort (no 401), e.g. for replica routing in db.py
+    token = _request_token(request)
+    return verify_session_token(token) if token else None
+
+
+def session_user_id(request: Request, response: Response) -> Optional[int]:
+    """
+    Dependency: user id from "Authorization: Bearer <token>" or the session cookie.
+    None when the request carries no token or one that does not verify; a stale
+    cookie is cleared so the client falls back to the body userId.
+    """
+    token = _request_token(request)
+    if not token:
+        return None
+    user_id = verify_session_token(token)
+    if user_id is None and request.cookies.get(SESSION_COOKIE) == token:
+        clear_session_cookie(response)
+    return user_id
+
+
+def read_pin_cookie(until: float) -> str:
+    """Set-Cookie value pinning this client's reads to the primary until `until` (epoch sec)."""
+    value = str(int(until) + 1)
+    max_age = max(1, int(until - time.time()) + 1)
+    cookie = (f"{READ_PIN_COOKIE}={value}.{_sign('read_pin:' + value)}; "
+              f"Max-Age={max_age}; Path=/; HttpOnly; SameSite=lax")
+    return cookie + "; Secure" if SESSION_COOKIE_SECURE else cookie
+
+
+def read_pin_until(request: Request) -> float:
+    """Deadline of a valid read pin cookie (epoch sec), else 0."""
+    token = request.cookies.get(READ_PIN_COOKIE)
+    if not token:
+        return 0.0
+    value, _, sig = token.partition(".")
+    if not sig or not hmac.compare_digest(sig, _sign("read_pin:" + value)):
+        return 0.0
+    try:
+        return float(int(value))
+    except ValueError:
+        return 0.0
+
+
+def acting_user_id(session_uid: Optional[int], body_uid) -> int:
+    """The caller's user id: the token's, else the legacy body userId."""
+    try:
+        body_id = int(body_uid or 0)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid userId")
+    if session_uid is not None:
+        if body_id and body_id != session_uid:
+            raise HTTPException(status_code=403, detail="userId does not match the session")
+        return session_uid
+    if body_id <= 0:
+        raise HTTPException(status_code=400, detail="Missing userId")
+    return body_id
+
+
+# -----------------------------
+# Principal cache
+# -----------------------------
+def _detached_copy(user: User) -> User:
+    # plain transient copy: safe to share between requests / sessions (read-only use)
+    return User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+
+
+class PrincipalCache:
+    """user id -> read-only User copy, TTL + LRU."""
+
+    def __init__(self, max_entries: int, ttl_sec: int) -> None:
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, tuple[float, User]]" = OrderedDict()
+        # bumped by every invalidation; a row read across one is not stored
+        self.generation = 0
+
+    def get(self, user_id: int) -> Optional[User]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user: User, generation: int) -> User:
+        copy = _detached_copy(user)
+        with self._lock:
+            if generation != self.generation:
+                return copy
+            self._entries[user.id] = (time.monotonic() + self.ttl_sec, copy)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return copy
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(user_id, None)
+
+
+PRINCIPALS = PrincipalCache(PRINCIPAL_MAX_ENTRIES, PRINCIPAL_TTL_SEC)
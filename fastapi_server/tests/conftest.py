@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+# the app imports its modules top-level (run from fastapi_server/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SESSION_SECRET", "test-secret")
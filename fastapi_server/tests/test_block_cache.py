@@ -0,0 +1,65 @@
+# tests/test_block_cache.py
+import asyncio
+
+import pytest
+
+import helper
+from block_cache import HiddenPeerCache
+
+
+class FakeSession:
+    opened = 0
+
+    async def __aenter__(self):
+        FakeSession.opened += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = HiddenPeerCache(max_entries=10, ttl_sec=60)
+    blocks = {1: {1, 5}}
+
+    async def hidden_peer_ids(db, me_id):
+        return set(blocks.get(me_id, {me_id}))
+
+    FakeSession.opened = 0
+    monkeypatch.setattr(helper, "HIDDEN_PEERS", cache)
+    monkeypatch.setattr(helper, "hidden_peer_ids", hidden_peer_ids)
+    monkeypatch.setattr(helper, "AsyncSessionLocal", FakeSession)
+    cache.blocks = blocks
+    return cache
+
+
+def test_hits_do_not_open_a_session(cache):
+    for _ in range(3):
+        assert asyncio.run(helper.cached_hidden_peer_ids(1)) == {1, 5}
+    assert FakeSession.opened == 1
+
+
+def test_invalidate_rereads_both_sides(cache):
+    asyncio.run(helper.cached_hidden_peer_ids(1))
+    asyncio.run(helper.cached_hidden_peer_ids(7))
+    cache.blocks[1] = {1, 5, 7}
+    cache.blocks[7] = {7, 1}
+    cache.invalidate(1, 7)  # what block_user() does
+
+    assert asyncio.run(helper.cached_hidden_peer_ids(1)) == {1, 5, 7}
+    assert asyncio.run(helper.cached_hidden_peer_ids(7)) == {7, 1}
+
+
+def test_read_across_an_invalidation_is_not_stored():
+    cache = HiddenPeerCache(max_entries=10, ttl_sec=60)
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.put(1, {1}, generation)
+    assert cache.get(1) is None
+
+
+def test_entries_expire():
+    cache = HiddenPeerCache(max_entries=10, ttl_sec=0)
+    cache.put(1, {1}, cache.generation)
+    assert cache.get(1) is None
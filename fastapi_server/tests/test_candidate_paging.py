@@ -0,0 +1,48 @@
+# tests/test_candidate_paging.py
+import random
+
+import pytest
+
+from helper import encode_offset_cursor, page_candidate_rows, page_ranked_rows, visible_ids
+from search_cache import candidate_rows
+
+
+def _rows(pairs):
+    # pairs: (created_us, id), newest first
+    return candidate_rows([i for _, i in pairs], [t for t, _ in pairs])
+
+
+def _drain(pager, rows, hidden, limit):
+    out, cursor = [], None
+    while True:
+        ids, cursor = pager(rows, hidden, cursor, limit)
+        out += ids
+        if cursor is None:
+            return out
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_pages_cover_visible_rows_in_order(seed):
+    rng = random.Random(seed)
+    n = rng.randint(0, 40)
+    # few distinct timestamps -> many created_at ties broken by id
+    pairs = sorted({(rng.randint(0, 5) * 1_000_000, i) for i in range(1, n + 1)}, reverse=True)
+    hidden = set(rng.sample(range(1, n + 2), rng.randint(0, min(4, n + 1))))
+    limit = rng.randint(1, 6)
+    rows = _rows(pairs)
+    expected = [i for _, i in pairs if i not in hidden]
+
+    assert visible_ids(rows, hidden) == expected
+    assert _drain(page_candidate_rows, rows, hidden, limit) == expected
+    assert _drain(page_ranked_rows, rows, hidden, limit) == expected
+
+
+def test_offset_past_the_end_is_empty():
+    rows = _rows([(3, 3), (2, 2), (1, 1)])
+    assert page_ranked_rows(rows, set(), encode_offset_cursor(10), 5) == ([], None)
+
+
+def test_rows_are_read_only():
+    rows = _rows([(1, 1)])
+    with pytest.raises(ValueError):
+        rows.ids[0] = 2
@@ -0,0 +1,65 @@
+# tests/test_match_graph.py
+import asyncio
+from datetime import date
+
+import pytest
+
+import match_graph
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    monkeypatch.setattr(match_graph, "_DIRTY", set())
+    monkeypatch.setattr(match_graph, "_FLUSHING", set())
+    monkeypatch.setattr(match_graph, "_LAST_BIRTHDAY_SWEEP", date.today())  # no sweep
+    monkeypatch.setattr(match_graph, "AsyncSessionLocal", FakeSession)
+    return match_graph
+
+
+def test_edit_during_recompute_stays_dirty(graph, monkeypatch):
+    seen_fresh = []
+
+    async def recompute(db, ids):
+        seen_fresh.append(graph.is_match_graph_fresh(1))
+        graph.mark_match_dirty(1)  # profile saved again after the SELECT ran
+
+    monkeypatch.setattr(graph, "recompute_matches", recompute)
+    graph.mark_match_dirty(1)
+    assert asyncio.run(graph.flush_dirty()) == 1
+
+    assert seen_fresh == [False]            # not served from user_matches mid-recompute
+    assert not graph.is_match_graph_fresh(1)  # the second edit is still pending
+
+
+def test_failed_flush_keeps_ids_dirty(graph, monkeypatch):
+    async def recompute(db, ids):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(graph, "recompute_matches", recompute)
+    graph.mark_match_dirty(2)
+    with pytest.raises(RuntimeError):
+        asyncio.run(graph.flush_dirty())
+
+    assert graph._DIRTY == {2}
+    assert not graph.is_match_graph_fresh(2)
+
+
+def test_successful_flush_marks_fresh(graph, monkeypatch):
+    async def recompute(db, ids):
+        pass
+
+    monkeypatch.setattr(graph, "recompute_matches", recompute)
+    graph.mark_match_dirty(3)
+    asyncio.run(graph.flush_dirty())
+    assert graph.is_match_graph_fresh(3)
@@ -0,0 +1,205 @@
+# tests/test_member_columns.py
+import logging
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from member_columns import MemberColumns
+from search_cache import SearchKey
+
+TODAY = date.today()
+NOW = datetime.now(timezone.utc)
+
+
+def born(age: int, days_later: int = 0) -> date:
+    # birthday `age` years ago today (+ days_later: still one year younger)
+    try:
+        d = TODAY.replace(year=TODAY.year - age)
+    except ValueError:
+        d = TODAY.replace(year=TODAY.year - age, day=28)
+    return d + timedelta(days=days_later)
+
+
+def member(id, **kw):
+    values = dict(
+        id=id, created_at=NOW - timedelta(minutes=id), last_seen_at=None,
+        is_email_verified=True, isdeleted=False, isfreezed=False,
+        gender=1, country=1, ff=1, smoking=1, height=170, birth_date=born(30), image_path="a.jpg",
+        filter_height_min=None, filter_height_max=None, filter_age_min=None, filter_age_max=None,
+        filter_family_status=[0], filter_smoking_status=0,
+    )
+    values.update(kw)
+    return SimpleNamespace(**values)
+
+
+MEMBERS = [
+    member(1),
+    member(2, gender=2, country=2),
+    member(3, gender=None),
+    member(4, image_path=None),
+    member(5, image_path=""),
+    member(6, birth_date=born(25)),                 # 25 today
+    member(7, birth_date=born(25, days_later=1)),   # 25 tomorrow -> 24
+    member(8, birth_date=None),
+    member(9, filter_height_min=160, filter_height_max=175),
+    member(10, filter_height_min=180, filter_height_max=190),
+    member(11, filter_height_min=180, filter_height_max=None),   # NULL bound = no filter
+    member(12, filter_age_min=20, filter_age_max=28),
+    member(13, filter_age_min=35, filter_age_max=45),
+    member(14, filter_age_min=None, filter_age_max=20),
+    member(15, filter_family_status=[2, 3]),
+    member(16, filter_family_status=[1]),
+    member(17, filter_family_status=None),
+    member(18, filter_family_status=[]),
+    member(19, filter_smoking_status=2),
+    member(20, filter_smoking_status=None),
+    member(21, filter_smoking_status=1),
+    member(22, is_email_verified=False),
+    member(23, isfreezed=True),
+    member(24, isdeleted=True),
+    member(25, smoking=None, ff=3, country=None),
+]
+
+
+def _active(u) -> bool:
+    # active_members_only()
+    return u.is_email_verified is True and u.isdeleted is not True and u.isfreezed is not True
+
+
+def _age(b: date) -> int:
+    return TODAY.year - b.year - ((TODAY.month, TODAY.day) < (b.month, b.day))
+
+
+def _accepts(lo, hi, value) -> bool:
+    # lo IS NULL OR hi IS NULL OR (lo <= value AND hi >= value)
+    return lo is None or hi is None or lo <= value <= hi
+
+
+def sql_matches(u, k: SearchKey) -> bool:
+    """search_user() + active_members_only() + apply_member_filters(), NULL = not matched."""
+    if not _active(u):
+        return False
+    for col, v in ((u.gender, k.gender), (u.ff, k.ff), (u.country, k.country), (u.smoking, k.smoking)):
+        if v is not None and col != v:
+            return False
+    if k.pic and not (u.image_path is not None and u.image_path != ""):
+        return False
+    if k.min_age or k.max_age:
+        if u.birth_date is None:
+            return False
+        if k.min_age and _age(u.birth_date) < k.min_age:
+            return False
+        if k.max_age and _age(u.birth_date) > k.max_age:
+            return False
+    if k.my_height is not None and not _accepts(u.filter_height_min, u.filter_height_max, k.my_height):
+        return False
+    if k.my_age is not None and not _accepts(u.filter_age_min, u.filter_age_max, k.my_age):
+        return False
+    if k.my_ff is not None and not set(u.filter_family_status or ()) & {0, k.my_ff}:
+        return False
+    if k.my_smoking is not None and u.filter_smoking_status not in (0, k.my_smoking):
+        return False
+    return True
+
+
+def key(**kw) -> SearchKey:
+    values = dict(
+        gender=None, ff=None, country=None, smoking=None, tz=None, pic=False,
+        min_age=0, max_age=0, name_key="",
+        my_height=None, my_age=None, my_ff=None, my_smoking=None, ranked=False,
+    )
+    values.update(kw)
+    return SearchKey(**values)
+
+
+@pytest.fixture
+def columns() -> MemberColumns:
+    cols = MemberColumns()
+    cols.rebuild([u for u in MEMBERS if _active(u)])  # what load_member_columns() selects
+    for u in MEMBERS:
+        if not _active(u):
+            cols.upsert(u)      # was active at the last rebuild ...
+            cols.sync_user(u)   # ... then frozen / deleted / unverified locally
+    return cols
+
+
+KEYS = {
+    "no filters": key(),
+    "gender": key(gender=1),
+    "gender other": key(gender=2),
+    "country": key(country=2),
+    "ff": key(ff=3),
+    "smoking": key(smoking=1),
+    "pic": key(pic=True),
+    "min age": key(min_age=25),
+    "max age": key(max_age=24),
+    "age range": key(min_age=25, max_age=30),
+    "age range exact": key(min_age=25, max_age=25),
+    "my height in range": key(my_height=170),
+    "my height high": key(my_height=185),
+    "my age": key(my_age=30),
+    "my age low": key(my_age=18),
+    "my ff any": key(my_ff=1),
+    "my ff listed": key(my_ff=2),
+    "my ff unlisted": key(my_ff=5),
+    "my smoking": key(my_smoking=1),
+    "my smoking other": key(my_smoking=2),
+    "combined": key(gender=1, pic=True, min_age=20, my_height=170, my_age=30, my_ff=2, my_smoking=2),
+}
+
+
+@pytest.mark.parametrize("name", KEYS)
+def test_mask_matches_sql_rules(columns, name):
+    k = KEYS[name]
+    expected = {u.id for u in MEMBERS if sql_matches(u, k)}
+    assert set(columns.candidates(k).ids.tolist()) == expected
+
+
+def test_candidates_are_newest_first(columns):
+    ids = columns.candidates(key()).ids.tolist()
+    assert ids == sorted(ids)  # created_at = NOW - id minutes
+
+
+def test_exclude_and_only(columns):
+    k = key(gender=1)
+    everyone = {u.id for u in MEMBERS if sql_matches(u, k)}
+
+    assert set(columns.candidates(k, exclude={1, 6, 2}).ids.tolist()) == everyone - {1, 6}
+    assert set(columns.candidates(k, only={1, 2, 9, 22}).ids.tolist()) == {1, 9}
+    assert set(columns.candidates(k, exclude={1}, only={1, 9}).ids.tolist()) == {9}
+    assert columns.candidates(k, only=set()).ids.tolist() == []
+
+
+def test_sync_user_moves_member_between_sets(columns):
+    u = member(9, filter_height_min=180, filter_height_max=190)
+    columns.sync_user(u)
+    assert 9 not in columns.candidates(key(my_height=170)).ids.tolist()
+    columns.sync_user(member(9))
+    assert 9 in columns.candidates(key(my_height=170)).ids.tolist()
+
+
+def test_cold_snapshot_does_not_serve_best():
+    cols = MemberColumns()
+    assert not cols.serves_users_feed(best=True, graph_fresh=False)
+    assert not cols.serves_users_feed(best=False, graph_fresh=False)
+
+
+def test_built_snapshot_serves_best_and_stale_graph_newest():
+    cols = MemberColumns()
+    cols.rebuild([])
+    assert cols.serves_users_feed(best=True, graph_fresh=True)
+    assert cols.serves_users_feed(best=False, graph_fresh=False)
+    assert not cols.serves_users_feed(best=False, graph_fresh=True)
+
+
+def test_unranked_fallback_is_logged_and_counted(caplog):
+    cols = MemberColumns()
+    with caplog.at_level(logging.WARNING, logger="app"):
+        cols.note_unranked_fallback()
+        cols.note_unranked_fallback()
+
+    assert cols.stats()["unranked_fallbacks"] == 2
+    assert cols.stats()["ready"] is False
+    # throttled: one warning per FALLBACK_LOG_EVERY_SEC
+    assert len([r for r in caplog.records if "served unranked" in r.getMessage()]) == 1
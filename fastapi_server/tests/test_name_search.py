@@ -0,0 +1,18 @@
+# tests/test_name_search.py
+from name_search import NamePrefixIndex
+
+
+def _index() -> NamePrefixIndex:
+    index = NamePrefixIndex()
+    index.rebuild([(1, "Dana Levi"), (2, "Dana Cohen"), (3, "Danny Katz"), (4, "Moshe Dan")])
+    return index
+
+
+def test_suggest_matches_name_prefixes():
+    assert {i["userId"] for i in _index().suggest("dan", 10)} == {1, 2, 3, 4}
+
+
+def test_suggest_skips_excluded_before_limit():
+    items = _index().suggest("dan", 2, exclude={1, 2})
+    assert len(items) == 2
+    assert not {i["userId"] for i in items} & {1, 2}
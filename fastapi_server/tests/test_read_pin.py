@@ -0,0 +1,89 @@
+# tests/test_read_pin.py
+import asyncio
+import time
+from typing import Optional
+
+import pytest
+from starlette.requests import Request
+
+import db
+import sessions
+
+
+@pytest.fixture(autouse=True)
+def replica_configured(monkeypatch):
+    monkeypatch.setattr(db, "REPLICA_DATABASE_URL", "postgresql://replica")
+    monkeypatch.setattr(db, "_REPLICA_DOWN_UNTIL", 0.0)
+    monkeypatch.setattr(db, "_RECENT_WRITERS", {})
+
+
+def _request(cookie: Optional[str] = None) -> Request:
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def _run(endpoint) -> list:
+    """Drive ReadPinMiddleware around a bare ASGI endpoint, return the sent messages."""
+    sent = []
+
+    async def app(scope, receive, send):
+        await endpoint()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": []}
+    asyncio.run(db.ReadPinMiddleware(app)(scope, receive, send))
+    return sent
+
+
+def _cookie_from(sent: list) -> Optional[str]:
+    for name, value in sent[0]["headers"]:
+        if name == b"set-cookie":
+            return value.decode().split(";", 1)[0]
+    return None
+
+
+def test_write_sets_a_cookie_that_pins_reads_on_any_worker():
+    async def write():
+        db.mark_recent_write(7)
+
+    cookie = _cookie_from(_run(write))
+    assert cookie and cookie.startswith(f"{sessions.READ_PIN_COOKIE}=")
+
+    # another worker: no local _RECENT_WRITERS entry, only the cookie
+    db._RECENT_WRITERS.clear()
+    assert not db._use_replica(_request(cookie), 7)
+    assert db._use_replica(_request(), 7)
+
+
+def test_write_in_threadpool_still_sets_the_cookie():
+    async def write():
+        await asyncio.to_thread(db.mark_recent_write, 7)  # like a sync `def` endpoint
+
+    assert _cookie_from(_run(write)) is not None
+
+
+def test_read_only_request_sets_no_cookie():
+    async def read():
+        pass
+
+    assert _cookie_from(_run(read)) is None
+
+
+def test_expired_or_forged_pin_is_ignored(monkeypatch):
+    expired = sessions.read_pin_cookie(time.time() - 10).split(";", 1)[0]
+    assert db._use_replica(_request(expired), None)
+
+    value = str(int(time.time()) + 60)
+    assert db._use_replica(_request(f"{sessions.READ_PIN_COOKIE}={value}.bogus"), None)
+
+    with monkeypatch.context() as m:
+        m.setattr(sessions, "_SECRET", b"some-other-secret")
+        foreign = sessions.read_pin_cookie(time.time() + 60).split(";", 1)[0]
+    assert db._use_replica(_request(foreign), None)
@@ -0,0 +1,27 @@
+# tests/test_relationships.py
+from helper import get_relationship_states, is_user_blocked, is_user_liked
+
+
+class FakeDB:
+    """Returns canned (peer_id, flag) rows; ids come back as ints like from Postgres."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, stmt):
+        return iter(self.rows)
+
+
+def test_string_peer_id_is_normalized():
+    states = get_relationship_states(FakeDB([(42, "liked"), (42, "blockedMe")]), 1, ["42"])
+    assert states == {42: {"liked": True, "likedMe": False, "blocked": False, "blockedMe": True}}
+
+
+def test_single_peer_helpers_accept_string_ids():
+    assert is_user_liked(FakeDB([(42, "liked")]), 1, "42") is True
+    assert is_user_blocked(FakeDB([(42, "liked")]), 1, "42") is False
+
+
+def test_duplicate_peer_ids_collapse():
+    states = get_relationship_states(FakeDB([]), 1, [7, "7"])
+    assert list(states) == [7]
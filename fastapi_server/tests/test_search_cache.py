@@ -0,0 +1,50 @@
+# tests/test_search_cache.py
+import pytest
+
+from search_cache import SearchKey, SearchResultCache, candidate_rows
+
+
+def _key(gender: int) -> SearchKey:
+    return SearchKey(
+        gender=gender, ff=None, country=None, smoking=None, tz=None, pic=False,
+        min_age=0, max_age=0, name_key="",
+        my_height=None, my_age=None, my_ff=None, my_smoking=None, ranked=False,
+    )
+
+
+def _rows(n: int):
+    return candidate_rows(range(n), range(n))  # 12 bytes per candidate
+
+
+@pytest.fixture
+def cache() -> SearchResultCache:
+    return SearchResultCache(max_entries=10, ttl_sec=60, max_bytes=12 * 100)
+
+
+def test_evicts_lru_past_byte_budget(cache):
+    cache.put(_key(1), _rows(40), cache.generation)
+    cache.put(_key(2), _rows(40), cache.generation)
+    cache.get(_key(1))                                # 2 is now least recently used
+    cache.put(_key(3), _rows(40), cache.generation)   # 120 candidates > 100
+
+    assert cache.get(_key(2)) is None
+    assert cache.get(_key(1)) is not None and cache.get(_key(3)) is not None
+    assert cache.stats()["bytes"] == 12 * 80
+    assert cache.evictions == 1
+
+
+def test_result_over_budget_is_not_cached(cache):
+    cache.put(_key(1), _rows(101), cache.generation)
+    assert cache.get(_key(1)) is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_and_invalidating_keep_byte_count(cache):
+    cache.put(_key(1), _rows(30), cache.generation)
+    cache.put(_key(1), _rows(10), cache.generation)
+    assert cache.stats()["bytes"] == 12 * 10
+
+    cache.invalidate_member({"gender": 1, "ff": None, "country": None, "smoking": None,
+                             "has_image": False, "birth_date": None})
+    assert cache.stats()["bytes"] == 0
+    assert cache.get(_key(1)) is None
@@ -0,0 +1,58 @@
+# tests/test_sessions.py
+from typing import Optional
+
+from fastapi import Response
+from starlette.requests import Request
+
+import sessions
+
+
+def _request(cookie: Optional[str] = None, bearer: Optional[str] = None) -> Request:
+    headers = []
+    if cookie:
+        headers.append((b"cookie", f"{sessions.SESSION_COOKIE}={cookie}".encode()))
+    if bearer:
+        headers.append((b"authorization", f"Bearer {bearer}".encode()))
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers})
+
+
+def _foreign_token(monkeypatch, user_id: int) -> str:
+    # what another worker / the previous process (different secret) issued
+    with monkeypatch.context() as m:
+        m.setattr(sessions, "_SECRET", b"some-other-secret")
+        return sessions.issue_session_token(user_id)
+
+
+def test_valid_cookie_resolves_user():
+    token = sessions.issue_session_token(7)
+    response = Response()
+    assert sessions.session_user_id(_request(cookie=token), response) == 7
+    assert "set-cookie" not in response.headers
+
+
+def test_token_from_other_secret_counts_as_absent_and_clears_cookie(monkeypatch):
+    token = _foreign_token(monkeypatch, 7)
+    response = Response()
+
+    assert sessions.verify_session_token(token) is None
+    assert sessions.session_user_id(_request(cookie=token), response) is None
+
+    cleared = response.headers["set-cookie"]
+    assert cleared.startswith(f"{sessions.SESSION_COOKIE}=")
+    assert "Max-Age=0" in cleared
+
+    # the legacy body userId is honoured again
+    assert sessions.acting_user_id(None, "42") == 42
+
+
+def test_foreign_bearer_token_is_ignored_without_touching_cookies(monkeypatch):
+    token = _foreign_token(monkeypatch, 7)
+    response = Response()
+    assert sessions.session_user_id(_request(bearer=token), response) is None
+    assert "set-cookie" not in response.headers
+
+
+def test_tampered_token_is_ignored():
+    sig = sessions.issue_session_token(7).partition(".")[2]
+    forged = sessions.issue_session_token(8).partition(".")[0] + "." + sig
+    assert sessions.session_user_id(_request(cookie=forged), Response()) is None
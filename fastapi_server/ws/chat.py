@@ -2,18 +2,22 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import json
 import uuid
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Set
 
-from fastapi import APIRouter, Depends, Query, WebSocket, WebSocketDisconnect
-from sqlalchemy import func, or_, select, and_
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy import case, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import get_db
-from helper import get_user
+from db import AsyncSessionLocal, get_async_db, get_async_read_db, mark_recent_write
+from helper import get_user_async
 from models.chat_message import ChatMessage
-from models.chat_room import ChatRoom  # kept import (safe), but unused now
+from models.conversation import Conversation
+from models.user import User
 
 router = APIRouter()
 
@@ -48,6 +52,8 @@ ROOM_LAST_DATE_LOCK = asyncio.Lock()
 # =========================
 EDIT_WINDOW_SECONDS = 15 * 60  # messages can be edited for 15 minutes after sending
 
+PREVIEW_CHARS = 120  # conversations.preview / lastPreview
+
 
 # ---------- utils ----------
 
@@ -126,15 +132,10 @@ async def _broadcast_date_if_needed(room_key: str, room_id_for_client, sent_at_i
         )
 
 
-def _seed_last_date_from_dm(db: Session, user1: int, user2: int) -> Optional[str]:
-    last_dt = db.execute(
-        select(func.max(ChatMessage.sent_at)).where(
-            or_(
-                and_(ChatMessage.from_user_id == user1, ChatMessage.to_user_id == user2),
-                and_(ChatMessage.from_user_id == user2, ChatMessage.to_user_id == user1),
-            )
-        )
-    ).scalar_one_or_none()
+async def _seed_last_date_from_dm(db: AsyncSession, user1: int, user2: int) -> Optional[str]:
+    last_dt = (await db.execute(
+        select(func.max(ChatMessage.sent_at)).where(ChatMessage.room_key == _room_id(user1, user2))
+    )).scalar_one_or_none()
 
     if not last_dt:
         return None
@@ -152,24 +153,103 @@ async def _seed_last_date(room_key: str, date_key: Optional[str]) -> None:
 # DB helpers (DM)
 # -------------------------
 
-def _load_dm_messages(db: Session, user1: int, user2: int, limit: int) -> list[dict]:
-    rows = db.execute(
-        select(ChatMessage)
-        .where(
-            or_(
-                and_(ChatMessage.from_user_id == user1, ChatMessage.to_user_id == user2),
-                and_(ChatMessage.from_user_id == user2, ChatMessage.to_user_id == user1),
-            )
+async def _load_dm_messages(
+    db: AsyncSession,
+    user1: int,
+    user2: int,
+    limit: int,
+    before: Optional[tuple[datetime, str]] = None,
+    after: Optional[tuple[datetime, str]] = None,
+) -> tuple[list[dict], bool]:
+    """
+    One page of a DM room off ix_chat_messages_room_key_sent, newest first.
+    before -> older than the cursor, after -> newer than it (the oldest
+    `limit` of those). Also returns whether more rows follow in that direction.
+    """
+    key = tuple_(ChatMessage.sent_at, ChatMessage.id)
+    q = select(ChatMessage).where(ChatMessage.room_key == _room_id(user1, user2))
+    if after is not None:
+        q = q.where(key > tuple_(*after)).order_by(ChatMessage.sent_at.asc(), ChatMessage.id.asc())
+    else:
+        if before is not None:
+            q = q.where(key < tuple_(*before))
+        q = q.order_by(ChatMessage.sent_at.desc(), ChatMessage.id.desc())
+
+    rows = list((await db.execute(q.limit(limit + 1))).scalars().all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+    return [_serialize_dm_message(m) for m in rows], has_more
+
+
+def _mark_dm_write(user_id: int, peer_id: int) -> None:
+    # /chat/history reads the replica (keyed by either side): pin both to the primary
+    mark_recent_write(user_id)
+    mark_recent_write(peer_id)
+
+
+def _preview(content: str | None) -> str:
+    return (content or "")[:PREVIEW_CHARS]
+
+
+async def _bump_conversations(db: AsyncSession, m: ChatMessage) -> None:
+    """
+    Inbox rows of both sides for a new message, in the caller's transaction:
+    total + 1, unread + 1 for the recipient, and m as the last message unless
+    a newer one is already recorded.
+    """
+    sides = [(m.from_user_id, m.to_user_id, 0)]
+    if m.to_user_id != m.from_user_id:
+        sides.append((m.to_user_id, m.from_user_id, 1))
+    sides.sort()  # same row lock order for A->B and B->A
+
+    ins = pg_insert(Conversation).values([
+        {
+            "user_id": user_id,
+            "peer_id": peer_id,
+            "last_message_id": m.id,
+            "last_from_user_id": m.from_user_id,
+            "last_at": m.sent_at,
+            "preview": _preview(m.content),
+            "unread_count": unread,
+            "total_count": 1,
+        }
+        for user_id, peer_id, unread in sides
+    ])
+    newer = ins.excluded.last_at >= Conversation.last_at
+    last = {
+        col: case((newer, ins.excluded[col]), else_=Conversation.__table__.c[col])
+        for col in ("last_message_id", "last_from_user_id", "last_at", "preview")
+    }
+    await db.execute(
+        ins.on_conflict_do_update(
+            index_elements=[Conversation.user_id, Conversation.peer_id],
+            set_={
+                **last,
+                "unread_count": Conversation.unread_count + ins.excluded.unread_count,
+                "total_count": Conversation.total_count + 1,
+            },
         )
-        .order_by(ChatMessage.sent_at.desc())
-        .limit(limit)
-    ).scalars().all()
+    )
 
-    return [_serialize_dm_message(m) for m in rows]
+
+async def _repreview_conversations(db: AsyncSession, m: ChatMessage) -> None:
+    # an edit only shows in the inbox if m is still the last message of the thread
+    await db.execute(
+        Conversation.__table__.update()
+        .where(
+            tuple_(Conversation.user_id, Conversation.peer_id).in_(
+                [(m.from_user_id, m.to_user_id), (m.to_user_id, m.from_user_id)]
+            ),
+            Conversation.last_message_id == m.id,
+        )
+        .values(preview=_preview(m.content))
+    )
 
 
-def _insert_dm_message(
-    db: Session,
+async def _insert_dm_message(
+    db: AsyncSession,
     user_id: int,
     peer_id: int,
     content: str,
@@ -187,13 +267,15 @@ def _insert_dm_message(
         read_at=None,
     )
     db.add(m)
-    db.flush()
-    db.refresh(m)
+    await db.flush()
+    await db.refresh(m)
+    await _bump_conversations(db, m)
+    _mark_dm_write(m.from_user_id, m.to_user_id)
     return _serialize_dm_message(m)
 
 
-def _edit_dm_message(db: Session, user_id: int, msg_id: str, new_content: str) -> Optional[dict]:
-    m = db.get(ChatMessage, msg_id)
+async def _edit_dm_message(db: AsyncSession, user_id: int, msg_id: str, new_content: str) -> Optional[dict]:
+    m = await db.get(ChatMessage, msg_id)
     if not m or m.from_user_id != user_id:
         return None
     if not _within_edit_window(m.sent_at):
@@ -201,52 +283,62 @@ def _edit_dm_message(db: Session, user_id: int, msg_id: str, new_content: str) -
 
     m.content = new_content
     m.edited_at = datetime.now(timezone.utc)
-    db.flush()
-    db.refresh(m)
+    await db.flush()
+    await db.refresh(m)
+    await _repreview_conversations(db, m)
+    _mark_dm_write(m.from_user_id, m.to_user_id)
     return _serialize_dm_message(m)
 
 
-def _mark_dm_delivered_for_user(db: Session, user_id: int, peer_id: int) -> list[str]:
+async def _mark_dm_delivered_for_user(db: AsyncSession, user_id: int, peer_id: int) -> list[str]:
     now = datetime.now(timezone.utc)
 
-    ids = db.execute(
+    ids = (await db.execute(
         select(ChatMessage.id).where(
             ChatMessage.from_user_id == peer_id,
             ChatMessage.to_user_id == user_id,
             ChatMessage.delivered_at.is_(None),
         )
-    ).scalars().all()
+    )).scalars().all()
 
     if not ids:
         return []
 
-    db.execute(
+    await db.execute(
         ChatMessage.__table__.update()
         .where(ChatMessage.id.in_(ids))
         .values(delivered_at=now)
     )
+    _mark_dm_write(user_id, peer_id)
     return list(ids)
 
 
-def _mark_dm_read_for_user(db: Session, user_id: int, peer_id: int) -> list[str]:
+async def _mark_dm_read_for_user(db: AsyncSession, user_id: int, peer_id: int) -> list[str]:
     now = datetime.now(timezone.utc)
 
-    ids = db.execute(
-        select(ChatMessage.id).where(
+    # one guarded UPDATE: a concurrent mark-read (other tab, socket + HTTP) waits on
+    # the row locks, re-checks read_at IS NULL and gets only the rows it flipped itself,
+    # so each side subtracts exactly its own count from unread_count
+    ids = (await db.execute(
+        ChatMessage.__table__.update()
+        .where(
             ChatMessage.from_user_id == peer_id,
             ChatMessage.to_user_id == user_id,
             ChatMessage.read_at.is_(None),
         )
-    ).scalars().all()
+        .values(read_at=now)
+        .returning(ChatMessage.id)
+    )).scalars().all()
 
     if not ids:
         return []
 
-    db.execute(
-        ChatMessage.__table__.update()
-        .where(ChatMessage.id.in_(ids))
-        .values(read_at=now)
+    await db.execute(
+        Conversation.__table__.update()
+        .where(Conversation.user_id == user_id, Conversation.peer_id == peer_id)
+        .values(unread_count=func.greatest(Conversation.unread_count - len(ids), 0))
     )
+    _mark_dm_write(user_id, peer_id)
     return list(ids)
 
 
@@ -317,30 +409,78 @@ def _with_date_separators(messages: list[dict]) -> list[dict]:
 # HTTP
 # =========================
 
+def _encode_message_cursor(sent_at_iso: str, msg_id: str) -> str:
+    raw = json.dumps({"t": sent_at_iso, "i": msg_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_message_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        sent_at = datetime.fromisoformat(raw["t"])
+        if sent_at.tzinfo is None:
+            sent_at = sent_at.replace(tzinfo=timezone.utc)
+        return sent_at, str(raw["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page_global_messages(
+    msgs: list[dict],
+    limit: int,
+    before: Optional[tuple[datetime, str]],
+    after: Optional[tuple[datetime, str]],
+) -> tuple[list[dict], bool]:
+    # in-memory twin of _load_dm_messages for the global rooms
+    def key(m: dict) -> tuple[datetime, str]:
+        return datetime.fromisoformat(m["sentAt"]), m["id"]
+
+    if after is not None:
+        page = sorted((m for m in msgs if key(m) > after), key=key)
+        return list(reversed(page[:limit])), len(page) > limit
+    page = sorted((m for m in msgs if before is None or key(m) < before), key=key, reverse=True)
+    return page[:limit], len(page) > limit
+
+
 @router.get("/chat/history")
 async def chat_history(
     user1: int = Query(...),
     user2: int = Query(...),
     limit: int = Query(200, ge=1, le=2000),
-    db: Session = Depends(get_db),
+    before: Optional[str] = Query(None, description="beforeCursor of a loaded page: older messages"),
+    after: Optional[str] = Query(None, description="afterCursor of a loaded page: newer messages"),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    before_key = _decode_message_cursor(before) if before else None
+    after_key = _decode_message_cursor(after) if after else None
+
     if _is_global(user2):
         rid = str(user2)
         async with GLOBAL_LOCK:
-            msgs = sorted(GLOBAL_MESSAGES.get(rid, []), key=lambda m: m["sentAt"], reverse=True)[:limit]
-            msgs = _with_date_separators(msgs)
-        return {"ok": True, "roomId": user2, "messages": msgs}
+            msgs, has_more = _page_global_messages(GLOBAL_MESSAGES.get(rid, []), limit, before_key, after_key)
+        room_id = user2
+    else:
+        msgs, has_more = await _load_dm_messages(db, user1, user2, limit, before_key, after_key)
+        room_id = _room_id(user1, user2)
 
-    msgs = _load_dm_messages(db, user1, user2, limit)
-    msgs = _with_date_separators(msgs)
-    return {"ok": True, "roomId": _room_id(user1, user2), "messages": msgs}
+    # msgs are newest first: page edges for the next request in either direction
+    return {
+        "ok": True,
+        "roomId": room_id,
+        "messages": _with_date_separators(msgs),
+        "hasMore": has_more,
+        "beforeCursor": _encode_message_cursor(msgs[-1]["sentAt"], msgs[-1]["id"]) if msgs else None,
+        "afterCursor": _encode_message_cursor(msgs[0]["sentAt"], msgs[0]["id"]) if msgs else None,
+    }
 
 
 @router.get("/chat/mark-read")
 async def mark_read(
     userId: int = Query(...),
     peerId: int = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if _is_global(peerId):
         return {"ok": True, "updated": []}
@@ -348,13 +488,13 @@ async def mark_read(
     rid = _room_id(userId, peerId)
 
     try:
-        updated = _mark_dm_read_for_user(db, userId, peerId)
+        updated = await _mark_dm_read_for_user(db, userId, peerId)
         if updated:
-            db.commit()
+            await db.commit()
         else:
-            db.rollback()
+            await db.rollback()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
 
     if updated:
@@ -363,67 +503,64 @@ async def mark_read(
     return {"ok": True, "updated": updated}
 
 
+def _encode_thread_cursor(last_at: datetime, peer_id: int) -> str:
+    raw = json.dumps({"t": _dt_to_iso_utc(last_at), "p": peer_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_thread_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["t"]), int(raw["p"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _threads_stmt(user: int, limit: int, before: Optional[tuple[datetime, int]]):
+    # inbox page straight off ix_conversations_user_last_at, newest first
+    q = (
+        select(Conversation, User.name.label("peer_name"))
+        .outerjoin(User, User.id == Conversation.peer_id)
+        .where(Conversation.user_id == user)
+    )
+    if before is not None:
+        q = q.where(tuple_(Conversation.last_at, Conversation.peer_id) < tuple_(*before))
+    return q.order_by(Conversation.last_at.desc(), Conversation.peer_id.desc()).limit(limit + 1)
+
+
 @router.get("/chat/threads")
 async def chat_threads(
     userId: int = Query(...),
     limit: int = Query(50, ge=1, le=500),
     includeGlobal: bool = Query(False),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="nextCursor of the previous page"),
+    db: AsyncSession = Depends(get_async_db),
 ):
     user = userId
     items: List[Dict] = []
+    before = _decode_thread_cursor(cursor) if cursor else None
 
-    received_from = db.execute(
-        select(ChatMessage.from_user_id).where(ChatMessage.to_user_id == user).distinct()
-    ).scalars().all()
-    sent_to = db.execute(
-        select(ChatMessage.to_user_id).where(ChatMessage.from_user_id == user).distinct()
-    ).scalars().all()
-    peer_ids = set(received_from) | set(sent_to)
-
-    for peer in peer_ids:
-        room_filter = or_(
-            and_(ChatMessage.from_user_id == user, ChatMessage.to_user_id == peer),
-            and_(ChatMessage.from_user_id == peer, ChatMessage.to_user_id == user),
-        )
-
-        last_msg = db.execute(
-            select(ChatMessage)
-            .where(room_filter)
-            .order_by(ChatMessage.sent_at.desc())
-            .limit(1)
-        ).scalars().first()
-
-        if not last_msg:
-            continue
-
-        unread = db.execute(
-            select(func.count())
-            .select_from(ChatMessage)
-            .where(
-                ChatMessage.from_user_id == peer,
-                ChatMessage.to_user_id == user,
-                ChatMessage.read_at.is_(None),
-            )
-        ).scalar_one()
-
-        count = db.execute(
-            select(func.count()).select_from(ChatMessage).where(room_filter)
-        ).scalar_one()
-
+    rows = (await db.execute(_threads_stmt(user, limit, before))).all()
+    for c, peer_name in rows[:limit]:
         items.append(
             {
-                "roomId": _room_id(user, peer),
-                "peerId": peer,
-                "peerName": get_user(db, peer).name,
-                "lastAt": _dt_to_iso_utc(last_msg.sent_at) or "",
-                "lastFromUserId": last_msg.from_user_id,
-                "lastPreview": (last_msg.content[:120] if last_msg.content else ""),
-                "unread": int(unread),
-                "count": int(count),
+                "roomId": _room_id(user, c.peer_id),
+                "peerId": c.peer_id,
+                "peerName": peer_name,
+                "lastAt": _dt_to_iso_utc(c.last_at) or "",
+                "lastFromUserId": c.last_from_user_id,
+                "lastPreview": c.preview or "",
+                "unread": c.unread_count,
+                "count": c.total_count,
             }
         )
+    next_cursor = (
+        _encode_thread_cursor(rows[limit - 1][0].last_at, rows[limit - 1][0].peer_id)
+        if len(rows) > limit else None
+    )
 
+    # global rooms live in memory: listed on the first page only
+    includeGlobal = includeGlobal and cursor is None
     if includeGlobal:
         async with GLOBAL_LOCK:
             for rid, msgs in GLOBAL_MESSAGES.items():
@@ -436,7 +573,7 @@ async def chat_threads(
                         "peerId": int(rid),
                         "lastAt": last["sentAt"] if last else "",
                         "lastFromUserId": last.get("fromUserId") if last else None,
-                        "lastPreview": (last["content"][:120] if last else ""),
+                        "lastPreview": (_preview(last["content"]) if last else ""),
                         "unread": 0,
                         "count": len(msgs),
                         "isGlobal": True,
@@ -444,7 +581,26 @@ async def chat_threads(
                 )
 
     items.sort(key=lambda x: x["lastAt"], reverse=True)
-    return {"ok": True, "threads": items[:limit]}
+    return {"ok": True, "threads": items, "nextCursor": next_cursor}
+
+
+@router.get("/chat/unread")
+async def chat_unread(
+    userId: int = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # badge counts: the user's conversations rows only (primary key prefix)
+    rows = (await db.execute(
+        select(Conversation.peer_id, Conversation.unread_count).where(
+            Conversation.user_id == userId,
+            Conversation.unread_count > 0,
+        )
+    )).all()
+    return {
+        "ok": True,
+        "total": sum(n for _, n in rows),
+        "byPeer": {str(peer_id): n for peer_id, n in rows},
+    }
 
 
 # =========================
@@ -456,8 +612,9 @@ async def ws_chat(
     ws: WebSocket,
     userId: int = Query(...),
     peerId: int = Query(...),
-    db: Session = Depends(get_db),
 ):
+    # No session for the socket lifetime: every DB operation below opens its
+    # own short session, so the pooled connection is returned between frames.
     await ws.accept()
 
     rid = _resolve_room(userId, peerId)
@@ -472,14 +629,17 @@ async def ws_chat(
                 last = max(msgs, key=lambda m: m["sentAt"])
                 await _seed_last_date(gr, _iso_date_utc(last["sentAt"]))
     else:
-        await _seed_last_date(rid, _seed_last_date_from_dm(db, userId, peerId))
+        async with AsyncSessionLocal() as db:
+            seeded = await _seed_last_date_from_dm(db, userId, peerId)
+        await _seed_last_date(rid, seeded)
 
     # GLOBAL presence JOIN
     prev_global: Optional[str] = None
     if _is_global(peerId):
         target = str(peerId)
 
-        u = get_user(db, userId)
+        async with AsyncSessionLocal() as db:
+            u = await get_user_async(db, userId)
         user_name = (getattr(u, "name", None) if u else None) or f"User {userId}"
 
         async with GLOBAL_ROOMS_LOCK:
@@ -510,15 +670,16 @@ async def ws_chat(
 
     # Mark delivered for DMs
     if not _is_global(peerId):
-        try:
-            delivered_ids = _mark_dm_delivered_for_user(db, userId, peerId)
-            if delivered_ids:
-                db.commit()
-            else:
-                db.rollback()
-        except Exception:
-            db.rollback()
-            raise
+        async with AsyncSessionLocal() as db:
+            try:
+                delivered_ids = await _mark_dm_delivered_for_user(db, userId, peerId)
+                if delivered_ids:
+                    await db.commit()
+                else:
+                    await db.rollback()
+            except Exception:
+                await db.rollback()
+                raise
 
         if delivered_ids:
             await _broadcast(rid, {"type": "delivered", "ids": delivered_ids, "roomId": rid})
@@ -547,15 +708,16 @@ async def ws_chat(
                             pass
                     continue
 
-                try:
-                    edited = _edit_dm_message(db, userId, msg_id, new_content)
-                    if edited:
-                        db.commit()
-                    else:
-                        db.rollback()
-                except Exception:
-                    db.rollback()
-                    raise
+                async with AsyncSessionLocal() as db:
+                    try:
+                        edited = await _edit_dm_message(db, userId, msg_id, new_content)
+                        if edited:
+                            await db.commit()
+                        else:
+                            await db.rollback()
+                    except Exception:
+                        await db.rollback()
+                        raise
 
                 if edited:
                     await _broadcast(rid, {"type": "edited", "roomId": rid, "msg": edited})
@@ -573,7 +735,8 @@ async def ws_chat(
             if not content:
                 continue
 
-            u = get_user(db, userId)
+            async with AsyncSessionLocal() as db:
+                u = await get_user_async(db, userId)
             from_name = getattr(u, "name", None) if u else None
 
             # Global room
@@ -599,12 +762,13 @@ async def ws_chat(
             sent_dt = datetime.now(timezone.utc)
             msg_id = str(uuid.uuid4())
 
-            try:
-                saved = _insert_dm_message(db=db, user_id=userId, peer_id=peerId, content=content, sent_at=sent_dt, msg_id=msg_id)
-                db.commit()
-            except Exception:
-                db.rollback()
-                raise
+            async with AsyncSessionLocal() as db:
+                try:
+                    saved = await _insert_dm_message(db=db, user_id=userId, peer_id=peerId, content=content, sent_at=sent_dt, msg_id=msg_id)
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
 
             msg = {
                 "id": saved["id"],
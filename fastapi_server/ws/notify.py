@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import time
+from datetime import datetime, timezone
 from typing import Dict, Set, Optional
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Body
+from sqlalchemy import DateTime, Integer, column, func, update, values
+
+from db import AsyncSessionLocal
+from models.user import User
 
 router = APIRouter()
+log = logging.getLogger("app")
 
 # =========================
 # In-memory state (single process)
@@ -18,9 +26,14 @@ USER_SOCKETS: Dict[int, Set[WebSocket]] = {}
 LAST_TOUCH: Dict[int, float] = {}  # last heartbeat we received
 LAST_SEEN:  Dict[int, float] = {}  # last time we knew user was online
 
+# Heartbeats not yet written to users.last_seen_at (userId -> epoch seconds).
+_SEEN_DIRTY: Dict[int, float] = {}
+
 # Heartbeat/presence tuning (seconds).
 HEARTBEAT_SEC = 25   # client sends a tiny ping this often
 TTL_SEC       = 90   # user is "online" if we were touched within this window
+LAST_SEEN_FLUSH_SEC = 30    # write-behind interval for users.last_seen_at
+LAST_SEEN_FLUSH_BATCH = 1000  # rows per UPDATE
 
 
 # =========================
@@ -35,10 +48,78 @@ def is_online(user_id: int, now: Optional[float] = None) -> bool:
     ts = LAST_TOUCH.get(user_id, 0.0)
     return (now - ts) <= TTL_SEC
 
+def online_user_ids(now: Optional[float] = None) -> list[int]:
+    if now is None:
+        now = _now()
+    return [uid for uid in LAST_TOUCH.keys() if is_online(uid, now)]
+
 def _touch(user_id: int) -> None:
     now = _now()
     LAST_TOUCH[user_id] = now
     LAST_SEEN[user_id]  = now
+    _SEEN_DIRTY[user_id] = now
+
+# =========================
+# last_seen_at write-behind
+# =========================
+async def flush_last_seen() -> int:
+    """
+    Write the heartbeats collected since the last flush to users.last_seen_at,
+    one UPDATE ... FROM (VALUES ...) per batch. GREATEST keeps a newer value
+    written by another worker (or by /login).
+    """
+    global _SEEN_DIRTY
+    if not _SEEN_DIRTY:
+        return 0
+    dirty, _SEEN_DIRTY = _SEEN_DIRTY, {}
+
+    items = [
+        (user_id, datetime.fromtimestamp(ts, tz=timezone.utc))
+        for user_id, ts in dirty.items()
+    ]
+    try:
+        async with AsyncSessionLocal() as db:
+            for i in range(0, len(items), LAST_SEEN_FLUSH_BATCH):
+                seen = values(
+                    column("user_id", Integer),
+                    column("seen_at", DateTime(timezone=True)),
+                    name="seen",
+                ).data(items[i:i + LAST_SEEN_FLUSH_BATCH])
+                await db.execute(
+                    update(User)
+                    .where(User.id == seen.c.user_id)
+                    .values(
+                        last_seen_at=func.greatest(User.last_seen_at, seen.c.seen_at),
+                        updated_at=User.updated_at,  # presence is not a profile edit
+                    )
+                )
+            await db.commit()
+    except Exception:
+        # put them back (newer heartbeats since the swap win), retry next round
+        for user_id, ts in dirty.items():
+            if _SEEN_DIRTY.get(user_id, 0.0) < ts:
+                _SEEN_DIRTY[user_id] = ts
+        raise
+    return len(items)
+
+
+async def _last_seen_worker() -> None:
+    while True:
+        await asyncio.sleep(LAST_SEEN_FLUSH_SEC)
+        try:
+            await flush_last_seen()
+        except Exception:
+            log.exception("last_seen_at flush failed")
+
+
+_LAST_SEEN_WORKER: Optional[asyncio.Task] = None
+
+
+def start_last_seen_worker() -> None:
+    global _LAST_SEEN_WORKER
+    if _LAST_SEEN_WORKER is None or _LAST_SEEN_WORKER.done():
+        _LAST_SEEN_WORKER = asyncio.create_task(_last_seen_worker())
+
 
 async def push_notify(user_id: int, payload: dict) -> None:
     """
@@ -111,8 +192,7 @@ async def presence_online(exclude: Optional[int] = None):
     Return the list of userIDs considered 'online' (heartbeat within TTL).
     Optional: ?exclude=<userId> to drop your own id from the list.
     """
-    now = _now()
-    online = [uid for uid in LAST_TOUCH.keys() if is_online(uid, now)]
+    online = online_user_ids()
     if exclude is not None:
         online = [u for u in online if u != exclude]
     online.sort()